@@ -0,0 +1,180 @@
+"""
+Soundtrack playback with preloaded players and crossfades.
+
+SoundtrackEngine owns a single VLC instance. Media for upcoming cues is opened
+ahead of time in a small pool of warm players, so starting a cue does not wait
+for the file to be opened and parsed, and tracks fade in and out over a
+configurable duration instead of cutting abruptly.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import vlc
+
+import telemetry
+
+DEFAULT_CROSSFADE_SECONDS = 1.5
+DEFAULT_POOL_SIZE = 4
+FADE_STEP_SECONDS = 0.05
+
+
+class _Fader(threading.Thread):
+    """Background thread that ramps player volumes towards their targets."""
+
+    def __init__(self):
+        super().__init__(name='soundtrack-fader', daemon=True)
+        self._fades = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+
+    def fade(self, player, start_volume, end_volume, duration, on_done=None):
+        if duration <= 0:
+            player.audio_set_volume(int(end_volume))
+            if on_done:
+                on_done(player)
+            return
+        with self._lock:
+            self._fades[player] = (start_volume, end_volume, time.monotonic(), duration, on_done)
+        self._wake.set()
+
+    def cancel(self, player):
+        with self._lock:
+            self._fades.pop(player, None)
+
+    def stop(self):
+        """
+        Stops the thread and returns the players whose fades had not finished. Their on_done
+        callbacks are not called.
+        """
+        with self._lock:
+            self._stopped = True
+            players = list(self._fades)
+            self._fades.clear()
+        self._wake.set()
+        self.join(timeout=1)  # Lets callbacks of fades that had just finished complete
+        return players
+
+    def run(self):
+        while not self._stopped:
+            self._wake.wait()
+            finished = []
+            with self._lock:
+                now = time.monotonic()
+                for player, (start_volume, end_volume, started, duration, on_done) in list(self._fades.items()):
+                    progress = min(1.0, (now - started) / duration)
+                    player.audio_set_volume(int(start_volume + (end_volume - start_volume) * progress))
+                    if progress >= 1.0:
+                        del self._fades[player]
+                        finished.append((player, on_done))
+                if not self._fades:
+                    self._wake.clear()
+            for player, on_done in finished:
+                if on_done:
+                    on_done(player)
+            time.sleep(FADE_STEP_SECONDS)
+
+
+class SoundtrackEngine:
+    def __init__(self, crossfade_seconds=DEFAULT_CROSSFADE_SECONDS, pool_size=DEFAULT_POOL_SIZE):
+        self.crossfade_seconds = crossfade_seconds
+        self.pool_size = pool_size
+        self._instance = vlc.Instance('--no-video')
+        self._warm = OrderedDict()  # mp3 file -> player with its media opened but not playing
+        self._playing = {}  # soundtrack -> (player, volume)
+        self._fader = _Fader()
+        self._fader.start()
+
+    def _new_player(self, mp3_file):
+        media = self._instance.media_new(mp3_file)
+        media.parse_with_options(vlc.MediaParseFlag.local, -1)  # Opens and probes the file in the background
+        player = self._instance.media_player_new()
+        player.set_media(media)
+        return player
+
+    def preload(self, mp3_files):
+        """
+        Opens media for tracks that are likely to start soon, keeping at most pool_size warm players.
+        """
+        playing_files = {soundtrack[1] for soundtrack in self._playing}
+        for mp3_file in mp3_files:
+            if mp3_file in self._warm or mp3_file in playing_files:
+                continue
+            self._warm[mp3_file] = self._new_player(mp3_file)
+            while len(self._warm) > self.pool_size:
+                _, player = self._warm.popitem(last=False)
+                player.release()
+
+    def _record_first_audio(self, player, mp3_file, requested_at):
+        reported = []
+
+        def on_time_changed(event):
+            if not reported:
+                reported.append(True)
+                telemetry.record("audio start", time.perf_counter() - requested_at, track=mp3_file)
+
+        player.event_manager().event_attach(vlc.EventType.MediaPlayerTimeChanged, on_time_changed)
+
+    def play(self, soundtrack, volume=100, requested_at=None):
+        """
+        Starts a (soundtrack key, mp3 file) pair, fading it in to `volume`.
+
+        `requested_at` is the time.perf_counter() of the page turn; the delay until the
+        first audio sample is recorded as the "audio start" timer while telemetry is enabled.
+        """
+        if soundtrack in self._playing:
+            return
+        mp3_file = soundtrack[1]
+        player = self._warm.pop(mp3_file, None) or self._new_player(mp3_file)
+        if requested_at is not None and telemetry.enabled:
+            self._record_first_audio(player, mp3_file, requested_at)
+        player.audio_set_volume(0 if self.crossfade_seconds > 0 else volume)
+        player.play()
+        self._playing[soundtrack] = (player, volume)
+        self._fader.fade(player, 0, volume, self.crossfade_seconds)
+
+    def stop(self, soundtrack):
+        """
+        Fades a playing soundtrack out and releases its player.
+        """
+        entry = self._playing.pop(soundtrack, None)
+        if entry is None:
+            return
+        player, volume = entry
+        self._fader.cancel(player)
+
+        def release(faded_player):
+            faded_player.stop()
+            faded_player.release()
+
+        current_volume = player.audio_get_volume()
+        self._fader.fade(player, current_volume if current_volume >= 0 else volume, 0, self.crossfade_seconds, release)
+
+    def play_only(self, soundtracks, volumes=None, requested_at=None):
+        """
+        Crossfades to exactly the given soundtracks: ones no longer listed fade out while new ones fade in.
+        """
+        volumes = volumes or {}
+        for soundtrack in list(self._playing):
+            if soundtrack not in soundtracks:
+                self.stop(soundtrack)
+        for soundtrack in soundtracks:
+            self.play(soundtrack, volumes.get(soundtrack, 100), requested_at)
+
+    def is_playing(self, soundtrack):
+        return soundtrack in self._playing
+
+    def shutdown(self):
+        fading = self._fader.stop()
+        players = [player for player, _ in self._playing.values()]
+        # Players fading out have left _playing already; the end of their fade would have released them
+        players += [player for player in fading if player not in players]
+        for player in players:
+            player.stop()
+            player.release()
+        for player in self._warm.values():
+            player.release()
+        self._playing.clear()
+        self._warm.clear()
+        self._instance.release()
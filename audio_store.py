@@ -0,0 +1,216 @@
+"""
+Packaging of a book's soundtracks into its conversion folder.
+
+Soundtracks are added as absolute MP3 paths on the author's machine. When a book
+is saved every track is copied into '<output_folder>/audio/' under the SHA-256
+of its bytes, so the same MP3 used for several cues is stored once, and the
+book's soundtracks are pointed at those relative paths. The converted folder
+then plays anywhere it is copied to.
+
+If ffmpeg is installed, tracks can also be transcoded to a uniform bitrate, and
+every track's integrated loudness (EBU R128) and duration are measured once and
+recorded in book_json["audio"]:
+
+    {"audio/<hash>.mp3": {"duration": 184.3, "loudness": -14.2, "gain": -3.8}}
+
+The reader turns the gain into a playback volume, so tracks play at the same
+perceived level without being decoded twice. Measurements are kept in a
+'<file>.json' next to each stored track, so saving a book again does not
+re-measure tracks that did not change.
+"""
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import telemetry
+from soundtrack_index import track_list
+
+AUDIO_FOLDER = 'audio'
+TARGET_LOUDNESS = -18.0  # LUFS the reader normalises tracks to
+MAX_VOLUME = 150  # Highest player volume used to bring up quiet tracks (100 plays a track as it is)
+
+_INTEGRATED_LOUDNESS = re.compile(r'I:\s+(-?[\d.]+|-inf) LUFS')
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def ffmpeg_available():
+    return shutil.which('ffmpeg') is not None
+
+
+def _run(command):
+    return subprocess.run(command, capture_output=True, text=True, errors='replace', check=True)
+
+
+def _copy_track(source_path, output_path, bitrate):
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        if bitrate:
+            _run(['ffmpeg', '-v', 'error', '-y', '-i', source_path, '-vn', '-c:a', 'libmp3lame',
+                  '-b:a', f'{bitrate}k', '-f', 'mp3', temp_path])
+        else:
+            shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def measure_track(path):
+    """
+    Returns a dict with the duration (seconds) and integrated loudness (LUFS) of an audio file, measured
+    with ffprobe and ffmpeg's ebur128 filter. Values that could not be measured are None.
+    """
+    duration = None
+    if shutil.which('ffprobe'):
+        completed = _run(['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+                          '-of', 'default=noprint_wrappers=1:nokey=1', path])
+        try:
+            duration = round(float(completed.stdout.strip()), 3)
+        except ValueError:
+            pass
+
+    completed = _run(['ffmpeg', '-hide_banner', '-nostats', '-i', path, '-vn',
+                      '-af', 'ebur128=framelog=quiet', '-f', 'null', '-'])
+    matches = _INTEGRATED_LOUDNESS.findall(completed.stderr)
+    loudness = float(matches[-1]) if matches and matches[-1] != '-inf' else None
+    return {"duration": duration, "loudness": loudness}
+
+
+def _package_track(source_path, audio_folder, bitrate, analyse):
+    """
+    Stores one track and returns its (file name, measurements or None). Runs in the worker threads.
+    """
+    extension = '.mp3' if bitrate else (posixpath.splitext(source_path)[1].lower() or '.mp3')
+    suffix = f'.{bitrate}k' if bitrate else ''
+    stored_before = os.path.dirname(source_path) == os.path.abspath(audio_folder)
+    if bitrate and stored_before and source_path.endswith(suffix + extension):
+        filename = os.path.basename(source_path)  # Transcoded at this bitrate by an earlier save, not again
+    else:
+        filename = _file_digest(source_path) + suffix + extension
+    output_path = os.path.join(audio_folder, filename)
+    if not os.path.exists(output_path):  # Same name means same content
+        _copy_track(source_path, output_path, bitrate)
+
+    if not analyse:
+        return filename, None
+    info_path = output_path + '.json'
+    if os.path.exists(info_path):
+        with open(info_path, 'r') as f:
+            return filename, json.load(f)
+    try:
+        info = measure_track(output_path)
+    except (OSError, subprocess.CalledProcessError) as e:
+        # The stored copy still plays, only at its own volume
+        print(f"Could not measure soundtrack {source_path}: {e}")
+        return filename, None
+    if info["loudness"] is not None:
+        info["gain"] = round(TARGET_LOUDNESS - info["loudness"], 2)
+    with open(info_path, 'w') as f:
+        json.dump(info, f)
+    return filename, info
+
+
+def _package_track_safely(source_path, audio_folder, bitrate, analyse):
+    try:
+        return _package_track(source_path, audio_folder, bitrate, analyse)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Could not package soundtrack {source_path}: {e}")
+        return None, None
+
+
+def _prune_audio_folder(audio_folder, referenced):
+    """
+    Removes the stored tracks (and their measurements) that the book no longer uses, such as
+    tracks removed from the book or stored at another bitrate by an earlier save. `referenced`
+    are the paths of the tracks in use.
+    """
+    kept = {os.path.basename(path) for path in referenced
+            if os.path.dirname(os.path.abspath(path)) == os.path.abspath(audio_folder)}
+    kept |= {filename + '.json' for filename in kept}
+    for filename in os.listdir(audio_folder):
+        if filename not in kept:
+            try:
+                os.remove(os.path.join(audio_folder, filename))
+            except OSError as e:
+                print(f"Could not remove unused soundtrack {filename}: {e}")
+
+
+def _source_path(source, output_folder):
+    # Tracks of a book that was packaged before are relative to its folder, others to the working directory
+    in_book = os.path.join(output_folder, source)
+    return os.path.abspath(in_book if not os.path.isabs(source) and os.path.exists(in_book) else source)
+
+
+def package_soundtracks(soundtracks, output_folder, bitrate=None, analyse=True, workers=None):
+    """
+    Copies a book's soundtracks into '<output_folder>/audio/' under content-addressed names.
+
+    Parameters:
+    - soundtracks (dict): The book's "start-end" page ranges mapped to one MP3 path or a list of them.
+    - output_folder (str): The book's conversion folder.
+    - bitrate (int): Optional bitrate in kbit/s the tracks are transcoded to as MP3. Needs ffmpeg.
+    - analyse (bool): Measure each track's loudness and duration. Needs ffmpeg.
+    - workers (int): Tracks packaged at once (default: CPU count).
+
+    Returns a tuple of the soundtracks dict pointing at the stored paths (relative to output_folder),
+    and a dict of stored paths to their measurements for book_json["audio"]. Tracks that cannot be
+    read keep their original path. Stored tracks the soundtracks no longer use are removed.
+    """
+    audio_folder = os.path.join(output_folder, AUDIO_FOLDER)
+    sources = sorted({track for value in soundtracks.values() for track in track_list(value)})
+    if not sources:
+        if os.path.isdir(audio_folder):
+            _prune_audio_folder(audio_folder, [])
+        return dict(soundtracks), {}
+    if (bitrate or analyse) and not ffmpeg_available():
+        print("ffmpeg is not installed; soundtracks are copied without transcoding or loudness analysis.")
+        bitrate, analyse = None, False
+
+    os.makedirs(audio_folder, exist_ok=True)
+    source_paths = [_source_path(source, output_folder) for source in sources]
+    # The work is done by ffmpeg processes and file copies, so threads are enough
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        results = list(executor.map(_package_track_safely, source_paths, [audio_folder] * len(sources),
+                                    [bitrate] * len(sources), [analyse] * len(sources)))
+
+    stored = {}
+    audio_info = {}
+    for source, (filename, info) in zip(sources, results):
+        if filename is None:
+            continue
+        stored[source] = posixpath.join(AUDIO_FOLDER, filename)
+        if info is not None:
+            audio_info[stored[source]] = info
+
+    packaged = {}
+    for key, value in soundtracks.items():
+        tracks = list(dict.fromkeys(stored.get(track, track) for track in track_list(value)))
+        packaged[key] = tracks if isinstance(value, (list, tuple)) else tracks[0]
+    # Tracks that could not be stored keep their path, which may be a track stored by an earlier save
+    _prune_audio_folder(audio_folder, [os.path.join(output_folder, track)
+                                       for value in packaged.values() for track in track_list(value)])
+    telemetry.count("soundtracks stored", len(set(stored.values())))
+    telemetry.count("soundtracks measured", len(audio_info))
+    return packaged, audio_info
+
+
+def track_volume(info, volume=100):
+    """
+    Returns the player volume that brings a track with the given book_json["audio"] entry to the
+    target loudness, starting from `volume`. Tracks without a measurement play at `volume`.
+    """
+    if not info or info.get("gain") is None:
+        return volume
+    return max(0, min(MAX_VOLUME, round(volume * 10 ** (info["gain"] / 20))))
@@ -0,0 +1,254 @@
+"""
+Times every stage of converting and reading a book, for tracking regressions.
+
+Usage:
+    python benchmarks/bench_conversion.py [--epub book.epub | synthetic book options] [--stages ...]
+                                          [--repeat N] [--output results.json] [--compare baseline.json]
+
+Without --epub a synthetic book is generated (see synthetic_epub.py for its options).
+Each stage runs in a fresh process, so its peak RSS is not inflated by the stages
+before it; the peak includes the untimed setup a stage needs, such as parsing the
+book before saving it. The best of --repeat runs is reported.
+
+Stages:
+    read_epub      ebooklib's epub.read_epub
+    parse_epub     conversion.parse_epub, reading and paginating the book
+    paginate       conversion.paginate_text over every chapter body
+    export_images  image_store.export_images into an empty folder
+    save           conversion.save_book in the chosen --format
+    reader         the reader's load_epub_content and display_html_content, on Qt's offscreen
+                   platform. Skipped, with the reason in the results, when Qt WebEngine or VLC
+                   cannot be loaded.
+
+Results are printed as a table and, with --output, written as JSON. --compare prints
+each stage's time relative to an earlier results file.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ebooklib import epub
+
+import conversion
+from image_store import export_images
+from synthetic_epub import add_arguments, make_epub
+
+STAGES = ["read_epub", "parse_epub", "paginate", "export_images", "save", "reader"]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def folder_size(folder):
+    return sum(os.path.getsize(os.path.join(path, name)) for path, _, names in os.walk(folder) for name in names)
+
+
+def stage_read_epub(epub_path, work_folder, options):
+    started = time.perf_counter()
+    epub.read_epub(epub_path)
+    return {"seconds": time.perf_counter() - started}
+
+
+def stage_parse_epub(epub_path, work_folder, options):
+    started = time.perf_counter()
+    book_json, _ = conversion.parse_epub(epub_path, options["chapter_workers"])
+    seconds = time.perf_counter() - started
+    return {"seconds": seconds, "chapters": len(book_json["chapters"]),
+            "pages": sum(len(chapter["text"]) for chapter in book_json["chapters"])}
+
+
+def stage_paginate(epub_path, work_folder, options):
+    _, items, _ = conversion.read_epub(epub_path)
+    chapter_bodies = [item.get_body_content().decode('utf-8') for item in items]
+    started = time.perf_counter()
+    for body in chapter_bodies:
+        conversion.paginate_text(body)
+    seconds = time.perf_counter() - started
+    return {"seconds": seconds, "html_mb": sum(len(body) for body in chapter_bodies) / 1e6}
+
+
+def stage_export_images(epub_path, work_folder, options):
+    _, _, book_images = conversion.read_epub(epub_path)
+    started = time.perf_counter()
+    export_images(book_images, work_folder)
+    seconds = time.perf_counter() - started
+    return {"seconds": seconds, "images": len(book_images), "image_mb": folder_size(work_folder) / 1e6}
+
+
+def stage_save(epub_path, work_folder, options):
+    book_json, book_images = conversion.parse_epub(epub_path, options["chapter_workers"])
+    started = time.perf_counter()
+    book_file = conversion.save_book(book_json, book_images, work_folder, book_format=options["format"])
+    seconds = time.perf_counter() - started
+    return {"seconds": seconds, "format": options["format"], "file_mb": os.path.getsize(book_file) / 1e6}
+
+
+def stage_reader(epub_path, work_folder, options):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PyQt5.QtCore import QEventLoop
+        from PyQt5.QtWidgets import QApplication
+        import filereader
+    except Exception as e:
+        return {"skipped": f"{type(e).__name__}: {e}"}
+
+    book_json, book_images = conversion.parse_epub(epub_path, options["chapter_workers"])
+    book_folder = os.path.dirname(conversion.save_book(book_json, book_images, work_folder, book_format=options["format"]))
+
+    class HeadlessReader(filereader.EpubReaderApp):
+        def prompt_for_epub_folder(self):
+            pass  # The folder is set by the benchmark instead of a file dialog
+
+        def calibrate_layout(self):
+            # Without a saved layout profile the reader would measure the offscreen page on start,
+            # delaying the book's first page and saving that measurement as the user's profile
+            pass
+
+    filereader.register_book_scheme()
+    app = QApplication([])
+    try:
+        reader = HeadlessReader()
+    except Exception as e:
+        return {"skipped": f"{type(e).__name__}: {e}"}
+
+    def wait_for_page():
+        loop = QEventLoop()
+        reader.web_view.loadFinished.connect(loop.quit)
+        loop.exec_()
+        reader.web_view.loadFinished.disconnect(loop.quit)
+
+    try:
+        reader.epub_folder = book_folder
+        reader.scheme_handler.book_folder = book_folder
+        started = time.perf_counter()
+        reader.load_epub_content()
+        wait_for_page()
+        first_page_seconds = time.perf_counter() - started
+        while getattr(reader, "book_loader", None) is not None:
+            app.processEvents()
+        load_seconds = time.perf_counter() - started
+
+        display_times = []
+        for page_number in range(1, min(options["reader_pages"], len(reader.book)) + 1):
+            html_page = reader.render_page(page_number)
+            page_started = time.perf_counter()
+            reader.display_html_content(html_page)
+            wait_for_page()
+            display_times.append(time.perf_counter() - page_started)
+    finally:
+        reader.render_cache.shutdown()
+        reader.audio.shutdown()
+
+    return {"seconds": load_seconds, "first_page_seconds": first_page_seconds,
+            "display_mean_ms": 1000 * sum(display_times) / max(1, len(display_times)),
+            "display_max_ms": 1000 * max(display_times, default=0)}
+
+
+def measure_stage(stage, epub_path, options):
+    """
+    Runs one stage in the current process, which bench_stage starts fresh for every run.
+    """
+    with tempfile.TemporaryDirectory() as work_folder:
+        result = globals()[f"stage_{stage}"](epub_path, work_folder, options)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def bench_stage(stage, epub_path, options, repeat):
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            runs.append(executor.submit(measure_stage, stage, epub_path, options).result())
+        if "skipped" in runs[-1]:
+            return runs[-1]
+    best = min(runs, key=lambda run: run["seconds"])
+    return dict(best, runs=[run["seconds"] for run in runs], peak_rss_mb=max(run["peak_rss_mb"] for run in runs))
+
+
+def git_revision():
+    try:
+        completed = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    except OSError:
+        return None
+    return completed.stdout.strip() or None
+
+
+def print_results(results, baseline=None):
+    baseline_stages = baseline["stages"] if baseline else {}
+    for stage, result in results["stages"].items():
+        if "skipped" in result:
+            print(f"{stage:<14} skipped ({result['skipped']})")
+            continue
+        line = f"{stage:<14} {result['seconds']:8.3f}s  peak RSS {result['peak_rss_mb']:7.1f} MB"
+        previous = baseline_stages.get(stage, {})
+        if previous.get("seconds"):
+            line += f"  ({result['seconds'] / previous['seconds']:.2f}x of {previous['seconds']:.3f}s at {baseline.get('revision')})"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark each stage of converting and reading a book.")
+    parser.add_argument("--epub", help="benchmark this ePub instead of a synthetic one")
+    add_arguments(parser)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--chapter-workers", type=int, default=None, help="processes used by parse_epub to paginate")
+    parser.add_argument("--format", choices=["json", "compact", "gzip", "pack"], default="json", help="book format saved")
+    parser.add_argument("--reader-pages", type=int, default=20, help="pages displayed in the reader stage")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    options = {"chapter_workers": args.chapter_workers, "format": args.format, "reader_pages": args.reader_pages}
+    with tempfile.TemporaryDirectory() as folder:
+        if args.epub:
+            epub_path = args.epub
+            book = {"epub": os.path.abspath(args.epub)}
+        else:
+            epub_path = os.path.join(folder, "synthetic.epub")
+            make_epub(epub_path, args.chapters, args.words, args.images, args.image_size, args.nesting, args.seed)
+            book = {"chapters": args.chapters, "words": args.words, "images": args.images,
+                    "image_size": args.image_size, "nesting": args.nesting, "seed": args.seed}
+        book["epub_mb"] = os.path.getsize(epub_path) / 1e6
+
+        results = {
+            "revision": git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "book": book,
+            "options": options,
+            "stages": {},
+        }
+        for stage in args.stages:
+            results["stages"][stage] = bench_stage(stage, epub_path, options, args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Compares the single-pass paginator with the original BeautifulSoup paginator.
+
+Usage:
+    python benchmarks/bench_pagination.py [--chapters N] [--paragraphs N] [--nesting N] [--repeat N]
+
+Both paginators are run over the same synthetic chapters; the script checks that
+they produce identical pages and prints the time each one took.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+
+from pagination import paginate_chapter
+from synthetic_epub import make_chapter
+
+
+def legacy_paginate(body_html):
+    """The BeautifulSoup pipeline parse_epub and paginate_text used before the single-pass paginator."""
+    soup = BeautifulSoup(body_html, 'html.parser')
+    images = [img['src'] for img in soup.find_all('img')]
+    soup = BeautifulSoup(str(soup), 'html.parser')
+    pages = {}
+    current_page = 1
+    current_content = []
+    current_word_count = 0
+    for item in soup.find_all(['p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'img']):
+        if item.name == 'img':
+            if item.get('src'):
+                current_content.append(str(item))
+                pages[current_page] = ''.join(current_content)
+                current_content = []
+                current_word_count = 0
+                current_page += 1
+        else:
+            word_count = len(item.get_text().split())
+            if current_word_count + word_count > 555:
+                pages[current_page] = ''.join(current_content)
+                current_page += 1
+                current_content = []
+                current_word_count = 0
+            current_content.append(str(item))
+            current_word_count += word_count
+    if current_content:
+        pages[current_page] = ''.join(current_content)
+    return pages, images
+
+
+def time_paginator(paginate, chapters, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = [paginate(chapter) for chapter in chapters]
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark chapter pagination.")
+    parser.add_argument("--chapters", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=400)
+    parser.add_argument("--nesting", type=int, default=3, help="depth of nested divs around every fifth paragraph")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    chapters = [make_chapter(rng, args.paragraphs, args.nesting) for _ in range(args.chapters)]
+    size_mb = sum(len(chapter) for chapter in chapters) / 1e6
+
+    legacy_time, legacy_results = time_paginator(legacy_paginate, chapters, args.repeat)
+    stream_time, stream_results = time_paginator(paginate_chapter, chapters, args.repeat)
+
+    if legacy_results != stream_results:
+        print("Paginators disagree!")
+        return 1
+
+    pages = sum(len(pages) for pages, _ in stream_results)
+    print(f"{args.chapters} chapters, {size_mb:.1f} MB of HTML, {pages} pages")
+    print(f"BeautifulSoup: {legacy_time:.3f}s")
+    print(f"single-pass:   {stream_time:.3f}s ({legacy_time / stream_time:.1f}x faster)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Synthetic ePub books for the benchmarks.
+
+Usage:
+    python benchmarks/synthetic_epub.py book.epub [--chapters N] [--words N] [--images N] [--image-size PX] [--nesting N]
+
+Chapters are filler text in paragraphs of 20-120 words, with every fifth
+paragraph wrapped in `nesting` levels of divs. Images are valid PNGs of random
+noise, so they do not compress and their size on disk is roughly PX x PX x 3
+bytes; they are spread evenly over the chapters.
+"""
+import argparse
+import random
+import struct
+import sys
+import zlib
+
+from ebooklib import epub
+
+WORDS = "the of and to in a is that for it as was with be by on not he this are or his from at which but have an they you were her she there".split()
+
+
+def make_png(rng, size):
+    """
+    Returns the bytes of a size x size RGB PNG filled with random noise.
+    """
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    rows = b''.join(b'\0' + rng.randbytes(size * 3) for _ in range(size))
+    header = struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(rows, 1)) + chunk(b'IEND', b'')
+
+
+def make_chapter(rng, paragraphs, nesting, image_sources=None):
+    """
+    Returns the body HTML of a chapter with the given number of paragraphs.
+
+    `image_sources` are spread evenly between the paragraphs; without them an img tag
+    pointing at '../images/img<N>.jpg' follows every 50th paragraph.
+    """
+    image_positions = {}
+    if image_sources is not None:
+        for number, src in enumerate(image_sources):
+            image_positions[(number + 1) * paragraphs // (len(image_sources) + 1)] = src
+
+    parts = ['<h1>Chapter</h1>']
+    for index in range(paragraphs):
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 120)))
+        paragraph = f'<p class="body">{text} <em>&amp; more</em></p>'
+        if index % 5 == 0:
+            paragraph = '<div class="section">' * nesting + paragraph + '</div>' * nesting
+        parts.append(paragraph)
+        if image_sources is None and index % 50 == 25:
+            parts.append(f'<p><img src="../images/img{index}.jpg" alt=""/></p>')
+        elif index in image_positions:
+            parts.append(f'<p><img src="{image_positions[index]}" alt=""/></p>')
+    return ''.join(parts)
+
+
+def make_epub(path, chapters=20, words=20000, images=10, image_size=256, nesting=3, seed=0):
+    """
+    Writes a synthetic ePub to path.
+
+    Parameters:
+    - chapters (int): Number of chapters.
+    - words (int): Approximate number of words per chapter.
+    - images (int): Number of distinct images in the book.
+    - image_size (int): Width and height of every image in pixels.
+    - nesting (int): Depth of the nested divs around every fifth paragraph.
+    - seed (int): Seed of the random text and images, so runs are repeatable.
+    """
+    rng = random.Random(seed)
+    book = epub.EpubBook()
+    book.set_identifier(f'synthetic-{seed}')
+    book.set_title(f'Synthetic {chapters}x{words}')
+    book.add_author('Benchmark')
+
+    image_names = [f'images/img{number}.png' for number in range(images)]
+    for number, name in enumerate(image_names):
+        book.add_item(epub.EpubItem(uid=f'img{number}', file_name=name, media_type='image/png',
+                                    content=make_png(rng, image_size)))
+
+    paragraphs = max(1, words // 70)  # Paragraphs average 70 words, plus the <em> text
+    items = []
+    for number in range(chapters):
+        chapter_images = image_names[number::chapters]
+        body = make_chapter(rng, paragraphs, nesting, [f'../{name}' for name in chapter_images])
+        item = epub.EpubHtml(title=f'Chapter {number + 1}', file_name=f'text/chapter{number + 1}.xhtml', lang='en')
+        item.content = f'<html><head><title>Chapter {number + 1}</title></head><body>{body}</body></html>'
+        book.add_item(item)
+        items.append(item)
+
+    book.toc = items
+    book.spine = ['nav'] + items
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    epub.write_epub(path, book)
+    return path
+
+
+def add_arguments(parser):
+    parser.add_argument("--chapters", type=int, default=20)
+    parser.add_argument("--words", type=int, default=20000, help="approximate words per chapter")
+    parser.add_argument("--images", type=int, default=10)
+    parser.add_argument("--image-size", type=int, default=256, help="image width and height in pixels")
+    parser.add_argument("--nesting", type=int, default=3, help="depth of nested divs around every fifth paragraph")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic ePub for benchmarking.")
+    parser.add_argument("output", help="ePub file to write")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    make_epub(args.output, args.chapters, args.words, args.images, args.image_size, args.nesting, args.seed)
+    print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
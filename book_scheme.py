@@ -0,0 +1,87 @@
+"""
+book:// URL scheme for the reader's QWebEngineView.
+
+Pages are loaded with a book:/// base URL, so relative image sources are
+requested from BookSchemeHandler, which streams the files from the open book's
+folder with a MIME type matching the file. Images no longer have to be inlined
+into every page as base64, and Chromium can cache them like any other resource.
+Images with downscaled variants (see image_variants) are answered with the
+smallest variant that still fills the viewport.
+"""
+import mimetypes
+import os
+
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice, QUrl
+from PyQt5.QtWebEngineCore import QWebEngineUrlRequestJob, QWebEngineUrlScheme, QWebEngineUrlSchemeHandler
+
+import telemetry
+from image_variants import pick_variant
+
+BOOK_SCHEME = b"book"
+BOOK_BASE_URL = QUrl("book:///")
+
+
+def register_book_scheme():
+    """
+    Registers the book:// scheme with Qt WebEngine. Must be called before the QApplication is created.
+    """
+    scheme = QWebEngineUrlScheme(BOOK_SCHEME)
+    scheme.setSyntax(QWebEngineUrlScheme.Syntax.Path)
+    scheme.setFlags(QWebEngineUrlScheme.SecureScheme | QWebEngineUrlScheme.LocalScheme)
+    QWebEngineUrlScheme.registerScheme(scheme)
+
+
+class BookSchemeHandler(QWebEngineUrlSchemeHandler):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.book_folder = None
+        self.viewport_width = 0  # CSS pixels available to an image
+        self.viewport_height = 0
+        self.pixel_ratio = 1.0  # Device pixels per CSS pixel
+        self.image_entries = {}  # Stored image path -> chapter["images"] entry with variants
+
+    def add_chapter_images(self, chapter_images):
+        """
+        Registers the variants recorded in a chapter's images dict.
+        """
+        for entry in chapter_images.values():
+            if isinstance(entry, dict):
+                self.image_entries[entry["src"]] = entry
+
+    def clear_images(self):
+        self.image_entries.clear()
+
+    def resolve(self, url_path):
+        """
+        Maps the path of a book:// URL to a file inside the book folder, or None if it falls outside it.
+        """
+        if not self.book_folder:
+            return None
+        book_folder = os.path.abspath(self.book_folder)
+        file_path = os.path.abspath(os.path.join(book_folder, url_path.lstrip('/')))
+        if os.path.commonpath([book_folder, file_path]) != book_folder:
+            return None
+        return file_path
+
+    def requestStarted(self, job):
+        url_path = job.requestUrl().path().lstrip('/')
+        entry = self.image_entries.get(url_path)
+        if entry is not None and self.viewport_width:
+            url_path = pick_variant(entry, self.viewport_width, self.viewport_height, self.pixel_ratio)
+        file_path = self.resolve(url_path)
+        if file_path is None or not os.path.isfile(file_path):
+            print(f"Image not found: {job.requestUrl().toString()}")
+            job.fail(QWebEngineUrlRequestJob.UrlNotFound)
+            return
+
+        with telemetry.timer("image load", path=url_path):
+            with open(file_path, "rb") as f:
+                data = f.read()
+        telemetry.count("image bytes", len(data))
+        mime_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+
+        # Parented to the job so the buffer lives until the reply has been read
+        buffer = QBuffer(parent=job)
+        buffer.setData(QByteArray(data))
+        buffer.open(QIODevice.ReadOnly)
+        job.reply(mime_type.encode(), buffer)
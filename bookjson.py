@@ -0,0 +1,181 @@
+"""
+Streaming reader and writer for book.json.
+
+write_book_json serialises one chapter at a time, so a book whose chapters come
+from a generator is never held in memory twice (as dicts and as text). It can
+write compact JSON instead of the indented layout, and gzip the output as
+book.json.gz. Files are written next to their final location and renamed into
+place.
+
+iter_book_json reads the file back in chunks and yields the top-level keys and
+then the chapters one by one, so the reader can show the first page before the
+rest of the book has been parsed. Like every book.json written by the converter,
+the file must have its "chapters" key after the title, author and soundtracks.
+"""
+import gzip
+import json
+import os
+
+BOOK_JSON_FILENAME = 'book.json'
+BOOK_JSON_GZ_FILENAME = 'book.json.gz'
+
+READ_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = ' \t\n\r'
+
+
+def _open_text(path, mode, compressed):
+    if compressed:
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _dumps(value, indent, level):
+    if indent is None:
+        return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+    return json.dumps(value, indent=indent).replace('\n', '\n' + ' ' * (indent * level))
+
+
+def _write_book(f, book_json, indent):
+    # The same layout as json.dump(book_json, f, indent=indent), with "chapters" moved last
+    newline = '' if indent is None else '\n'
+    key_separator = ':' if indent is None else ': '
+    level_1 = newline + ' ' * (indent or 0)
+    level_2 = newline + ' ' * (2 * (indent or 0))
+
+    fields = [(key, value) for key, value in book_json.items() if key != "chapters"]
+    f.write('{')
+    for position, (key, value) in enumerate(fields):
+        f.write((',' if position else '') + level_1 + _dumps(key, indent, 1) + key_separator + _dumps(value, indent, 1))
+
+    f.write((',' if fields else '') + level_1 + '"chapters"' + key_separator + '[')
+    chapter_count = 0
+    for chapter in book_json.get("chapters", ()):
+        f.write((',' if chapter_count else '') + level_2 + _dumps(chapter, indent, 2))
+        chapter_count += 1
+    f.write((level_1 if chapter_count else '') + ']' + newline + '}')
+
+
+def write_book_json(book_json, path, indent=None):
+    """
+    Writes a book dict to path, gzip-compressed if the path ends in '.gz'.
+
+    Parameters:
+    - book_json (dict): The book.json structure. "chapters" may be any iterable, such as a generator
+      of chapters as they are paginated; it is only iterated once.
+    - path (str): File to write.
+    - indent (int): Indentation of the json.dump(indent=...) layout, or None for compact output.
+
+    Returns path.
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with _open_text(temp_path, 'w', path.endswith('.gz')) as f:
+            _write_book(f, book_json, indent)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return path
+
+
+class _ChunkReader:
+    """Buffers a text file and decodes one JSON value or punctuation mark at a time."""
+
+    def __init__(self, f):
+        self._file = f
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._position = 0
+        self._eof = False
+
+    def _fill(self, size):
+        chunk = self._file.read(size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        return True
+
+    def _skip_whitespace(self):
+        while True:
+            while self._position < len(self._buffer) and self._buffer[self._position] in _WHITESPACE:
+                self._position += 1
+            if self._position < len(self._buffer) or not self._fill(READ_CHUNK_SIZE):
+                return
+
+    def peek(self):
+        self._skip_whitespace()
+        return self._buffer[self._position] if self._position < len(self._buffer) else ''
+
+    def expect(self, characters):
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError(f"Expected one of {characters!r} in book.json, found {character!r}")
+        self._position += 1
+        return character
+
+    def value(self):
+        self._skip_whitespace()
+        read_size = READ_CHUNK_SIZE
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                # Most likely cut off by the end of the buffer; read more, doubling the reads for large values
+                if not self._fill(read_size):
+                    raise
+                read_size *= 2
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self._buffer) and not self._eof and self._fill(READ_CHUNK_SIZE):
+                continue
+            self._position = end
+            return value
+
+
+def iter_book_json(path):
+    """
+    Parses a book.json (or book.json.gz) incrementally.
+
+    Yields (key, value) for every top-level key except "chapters", in file order, and
+    ("chapter", chapter dict) for each chapter as soon as it has been read.
+    """
+    with _open_text(path, 'r', path.endswith('.gz')) as f:
+        reader = _ChunkReader(f)
+        reader.expect('{')
+        if reader.peek() == '}':
+            return
+        while True:
+            key = reader.value()
+            reader.expect(':')
+            if key == "chapters":
+                reader.expect('[')
+                if reader.peek() != ']':
+                    while True:
+                        yield "chapter", reader.value()
+                        if reader.expect(',]') == ']':
+                            break
+                else:
+                    reader.expect(']')
+            else:
+                yield key, reader.value()
+            if reader.expect(',}') == '}':
+                return
+
+
+def load_book_json(path):
+    """
+    Reads a whole book.json (or book.json.gz) into a book dict.
+    """
+    book_json = {}
+    chapters = []
+    for key, value in iter_book_json(path):
+        if key == "chapter":
+            chapters.append(value)
+        else:
+            book_json[key] = value
+    book_json["chapters"] = chapters
+    return book_json
@@ -0,0 +1,187 @@
+"""
+Compact, lazily loadable container for converted books (book.pack).
+
+A pack stores every page as its own (optionally zlib-compressed) frame, followed
+by a fixed-width offset index and a small JSON metadata block:
+
+    header     magic, version, flags, page count, index offset, metadata offset/length
+    frames     page 1 .. page N
+    index      N x (offset: uint64, length: uint32)
+    metadata   JSON: title, author, soundtracks, chapters (title, page count, images)
+
+Opening a pack reads the header and metadata only; pages are sliced out of a
+memory map on demand, so opening time and memory use do not grow with the
+number of pages.
+
+Usage:
+    python bookpack.py path/to/book.json[.gz] [--output book.pack] [--no-compress]
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+from bookjson import iter_book_json
+
+PACK_FILENAME = 'book.pack'
+
+MAGIC = b'EPMPACK\0'
+VERSION = 1
+FLAG_ZLIB = 1
+
+_HEADER = struct.Struct('<8sIIQQQQ')
+_INDEX_ENTRY = struct.Struct('<QI')
+
+
+def write_pack(book_json, pack_path, compress=True):
+    """
+    Writes a book dict (the book.json structure) to a pack file.
+
+    The file is written next to its final location and renamed into place, so
+    readers never see a partially written pack.
+    """
+    flags = FLAG_ZLIB if compress else 0
+    chapters = []
+    index = []
+    temp_path = f"{pack_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(b'\0' * _HEADER.size)
+            for chapter in book_json["chapters"]:
+                pages = chapter["text"]
+                for page_number in sorted(pages, key=int):
+                    frame = pages[page_number].encode('utf-8')
+                    if compress:
+                        frame = zlib.compress(frame)
+                    index.append((f.tell(), len(frame)))
+                    f.write(frame)
+                chapters.append({
+                    "title": chapter["title"],
+                    "pages": len(pages),
+                    "images": chapter.get("images", {}),
+                })
+
+            index_offset = f.tell()
+            for offset, length in index:
+                f.write(_INDEX_ENTRY.pack(offset, length))
+
+            metadata = {key: value for key, value in book_json.items() if key != "chapters"}
+            metadata["chapters"] = chapters
+            metadata_bytes = json.dumps(metadata).encode('utf-8')
+            metadata_offset = f.tell()
+            f.write(metadata_bytes)
+
+            f.seek(0)
+            f.write(_HEADER.pack(MAGIC, VERSION, flags, len(index), index_offset, metadata_offset, len(metadata_bytes)))
+        os.replace(temp_path, pack_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return pack_path
+
+
+class PackedBook:
+    """
+    Read-only view of a pack file.
+
+    Behaves like the reader's flat page dict: len() is the number of pages and
+    book[n] returns the HTML of global page n (1-based), read and decompressed
+    only when it is asked for.
+    """
+
+    def __init__(self, pack_path):
+        self.path = pack_path
+        self._file = open(pack_path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            (magic, version, self.flags, self.page_count, self._index_offset,
+             metadata_offset, metadata_length) = _HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC or version > VERSION:
+                raise ValueError(f"{pack_path} is not a supported book pack")
+            self.metadata = json.loads(self._map[metadata_offset:metadata_offset + metadata_length].decode('utf-8'))
+        except Exception:
+            self._file.close()
+            raise
+
+    @property
+    def title(self):
+        return self.metadata["title"]
+
+    @property
+    def author(self):
+        return self.metadata["author"]
+
+    @property
+    def soundtracks(self):
+        return self.metadata.get("soundtracks", {})
+
+    @property
+    def chapters(self):
+        return self.metadata["chapters"]
+
+    def __len__(self):
+        return self.page_count
+
+    def __contains__(self, page_number):
+        return isinstance(page_number, int) and 1 <= page_number <= self.page_count
+
+    def __getitem__(self, page_number):
+        if page_number not in self:
+            raise KeyError(page_number)
+        offset, length = _INDEX_ENTRY.unpack_from(self._map, self._index_offset + (page_number - 1) * _INDEX_ENTRY.size)
+        frame = self._map[offset:offset + length]
+        if self.flags & FLAG_ZLIB:
+            frame = zlib.decompress(frame)
+        return frame.decode('utf-8')
+
+    def get(self, page_number, default=None):
+        return self[page_number] if page_number in self else default
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def import_book_json(json_path, pack_path=None, compress=True):
+    """
+    Converts an existing book.json (or book.json.gz) into a pack file, by default next to it as book.pack.
+    """
+    if pack_path is None:
+        pack_path = os.path.join(os.path.dirname(json_path), PACK_FILENAME)
+
+    # Chapters are packed as they are read; the other keys are collected on the way, before
+    # write_pack builds the metadata after the last chapter
+    def streamed_chapters():
+        for key, value in iter_book_json(json_path):
+            if key == "chapter":
+                yield value
+            else:
+                book_json[key] = value
+
+    book_json = {"chapters": streamed_chapters()}
+    return write_pack(book_json, pack_path, compress)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a book.json into a lazily loadable book.pack.")
+    parser.add_argument("book_json", help="path of the book.json to import")
+    parser.add_argument("-o", "--output", help="pack file to write (default: book.pack next to the input)")
+    parser.add_argument("--no-compress", action="store_true", help="store pages uncompressed")
+    args = parser.parse_args(argv)
+
+    pack_path = import_book_json(args.book_json, args.output, not args.no_compress)
+    print(f"Wrote {pack_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
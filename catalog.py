@@ -0,0 +1,215 @@
+"""
+Library catalog of converted books (catalog.db).
+
+Every book saved into a library folder (the folder holding the <Title>conversion
+folders) is recorded in a SQLite file next to them: title, author, chapter and
+page counts, a soundtrack summary and a cover thumbnail. The reader lists and
+filters the books from this one file instead of opening every book.json.
+
+The converters update the catalog after each book they save. Libraries
+converted before the catalog existed can be catalogued with:
+
+    python catalog.py path/to/library
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from bookjson import BOOK_JSON_FILENAME, BOOK_JSON_GZ_FILENAME, iter_book_json
+from bookpack import PACK_FILENAME, PackedBook
+from image_variants import image_source
+from soundtrack_index import track_list
+
+CATALOG_FILENAME = 'catalog.db'
+CATALOG_VERSION = 1
+COVER_MAX_BYTES = 256 * 1024  # Larger images are only catalogued through their thumbnail variant
+BOOK_FILENAMES = (PACK_FILENAME, BOOK_JSON_GZ_FILENAME, BOOK_JSON_FILENAME)  # In the order the reader prefers them
+
+CatalogEntry = namedtuple('CatalogEntry', ['folder', 'title', 'author', 'chapters', 'pages', 'cues', 'tracks',
+                                           'audio_seconds', 'cover'])
+
+
+def cover_thumbnail(book_folder, image_entry):
+    """
+    Returns the bytes of the thumbnail variant of a chapter image entry, or of the image itself
+    if it is small, or None.
+    """
+    if image_entry is None:
+        return None
+    if isinstance(image_entry, dict) and "thumb" in image_entry.get("variants", {}):
+        path = image_entry["variants"]["thumb"]["src"]
+    else:
+        path = image_source(image_entry)
+    file_path = os.path.join(book_folder, path)
+    try:
+        if os.path.getsize(file_path) > COVER_MAX_BYTES:
+            return None
+        with open(file_path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def soundtrack_summary(soundtracks, audio_info):
+    """
+    Returns the number of cues, distinct tracks, and the tracks' total duration in seconds
+    (None if no duration was measured).
+    """
+    tracks = {track for value in soundtracks.values() for track in track_list(value)}
+    durations = [audio_info[track]["duration"] for track in tracks
+                 if (audio_info.get(track) or {}).get("duration") is not None]
+    return len(soundtracks), len(tracks), sum(durations) if durations else None
+
+
+class Catalog:
+    def __init__(self, library_folder, read_only=False):
+        self.library_folder = library_folder
+        self.path = os.path.join(library_folder, CATALOG_FILENAME)
+        if read_only:
+            db_uri = Path(os.path.abspath(self.path)).as_uri() + "?mode=ro"
+            self._connection = sqlite3.connect(db_uri, uri=True, check_same_thread=False)
+            return
+        # Several convert.py workers may save books into the same library at once
+        self._connection = sqlite3.connect(self.path, timeout=30)
+        self._connection.executescript(f'''
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS books (
+                folder TEXT PRIMARY KEY, title TEXT, author TEXT, chapters INTEGER, pages INTEGER,
+                cues INTEGER, tracks INTEGER, audio_seconds REAL, cover BLOB, book_file TEXT, updated REAL);
+            CREATE INDEX IF NOT EXISTS books_by_title ON books (title COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS books_by_author ON books (author COLLATE NOCASE);
+            PRAGMA user_version = {CATALOG_VERSION};
+        ''')
+
+    def add_book(self, book_folder, book_json, page_counts, book_file, cover_entry=None):
+        """
+        Records (or updates) a converted book.
+
+        Parameters:
+        - book_folder (str): The book's conversion folder inside the library folder.
+        - book_json (dict): The book's metadata (title, author, soundtracks, audio); chapters are not read.
+        - page_counts (list of int): Number of pages of each chapter.
+        - book_file (str): Path of the written book.json, book.json.gz or book.pack.
+        - cover_entry: The chapter image entry used as the book's cover, or None.
+        """
+        cues, tracks, audio_seconds = soundtrack_summary(book_json.get("soundtracks", {}), book_json.get("audio", {}))
+        folder = os.path.relpath(book_folder, self.library_folder)
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO books VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (folder, book_json["title"], book_json["author"], len(page_counts), sum(page_counts), cues, tracks,
+                 audio_seconds, cover_thumbnail(book_folder, cover_entry), os.path.basename(book_file), time.time()))
+
+    def remove_book(self, folder):
+        with self._connection:
+            self._connection.execute("DELETE FROM books WHERE folder = ?", (folder,))
+
+    def books(self, text=''):
+        """
+        Returns the CatalogEntry of every book whose title or author contains `text`, ordered by title.
+        The entries' folders are relative to the library folder.
+        """
+        pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        rows = self._connection.execute(
+            "SELECT folder, title, author, chapters, pages, cues, tracks, audio_seconds, cover FROM books "
+            "WHERE title LIKE ? ESCAPE '\\' OR author LIKE ? ESCAPE '\\' ORDER BY title COLLATE NOCASE",
+            (pattern, pattern)).fetchall()
+        return [CatalogEntry(*row) for row in rows]
+
+    def close(self):
+        self._connection.close()
+
+
+def record_book(library_folder, book_folder, book_json, page_counts, book_file, cover_entry=None):
+    """
+    Adds a book to the catalog of its library folder, creating the catalog if needed.
+    """
+    catalog = Catalog(library_folder)
+    try:
+        catalog.add_book(book_folder, book_json, page_counts, book_file, cover_entry)
+    finally:
+        catalog.close()
+
+
+def _first_image(images):
+    return next(iter(images.values()), None) if images else None
+
+
+def read_book_summary(book_folder):
+    """
+    Reads what the catalog records about an already converted book, streaming its chapters.
+
+    Returns (book metadata, page counts, book file, cover entry), or None if the folder has no book.
+    """
+    for filename in BOOK_FILENAMES:
+        book_file = os.path.join(book_folder, filename)
+        if os.path.exists(book_file):
+            break
+    else:
+        return None
+
+    if filename == PACK_FILENAME:
+        book = PackedBook(book_file)
+        try:
+            chapters = book.metadata["chapters"]
+            cover = next((image for image in (_first_image(chapter.get("images")) for chapter in chapters) if image), None)
+            return book.metadata, [chapter["pages"] for chapter in chapters], book_file, cover
+        finally:
+            book.close()
+
+    metadata = {}
+    page_counts = []
+    cover = None
+    for key, value in iter_book_json(book_file):
+        if key == "chapter":
+            page_counts.append(len(value["text"]))
+            cover = cover or _first_image(value.get("images"))
+        else:
+            metadata[key] = value
+    return metadata, page_counts, book_file, cover
+
+
+def catalog_library(library_folder):
+    """
+    Records every converted book found in the library folder's subfolders and drops catalog
+    entries whose folder no longer holds a book. Returns the number of books catalogued.
+    """
+    catalog = Catalog(library_folder)
+    try:
+        found = set()
+        for name in sorted(os.listdir(library_folder)):
+            book_folder = os.path.join(library_folder, name)
+            if not os.path.isdir(book_folder):
+                continue
+            try:
+                summary = read_book_summary(book_folder)
+            except Exception as e:
+                print(f"Skipping {book_folder}: {type(e).__name__}: {e}")
+                continue
+            if summary is not None:
+                catalog.add_book(book_folder, *summary)
+                found.add(name)
+        for entry in catalog.books():
+            if entry.folder not in found:
+                catalog.remove_book(entry.folder)
+    finally:
+        catalog.close()
+    return len(found)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Catalog the converted books of a library folder for the reader.")
+    parser.add_argument("library", help="folder holding the <Title>conversion folders")
+    args = parser.parse_args(argv)
+
+    count = catalog_library(args.library)
+    print(f"Catalogued {count} books in {os.path.join(args.library, CATALOG_FILENAME)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
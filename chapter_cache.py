@@ -0,0 +1,140 @@
+"""
+Persistent on-disk cache of paginated chapters.
+
+Entries are keyed by a hash of the chapter body and the pagination parameters,
+so re-converting an edited ePub only re-paginates the chapters that changed.
+The cache is bounded in size; the least recently used entries are evicted first.
+Its total size is kept in a small usage file in the cache folder, shared by the
+processes using the cache, so the folder is only walked when entries are evicted.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import zlib
+
+DEFAULT_CACHE_FOLDER = os.path.join(os.path.expanduser('~'), '.cache', 'epubmp3enhancer', 'chapters')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+ENTRY_SUFFIX = '.json.z'
+USAGE_FILENAME = 'usage.json'
+EVICT_TO = 0.9  # Eviction frees space down to this share of max_bytes, so that it runs rarely
+
+
+class ChapterCache:
+    def __init__(self, folder=DEFAULT_CACHE_FOLDER, max_bytes=DEFAULT_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.folder, exist_ok=True)
+        self._usage_path = os.path.join(self.folder, USAGE_FILENAME)
+        self._total_bytes = self._read_usage()
+        if self._total_bytes is None:  # New cache folder, or its usage file was lost
+            self._total_bytes = sum(size for _, size, _ in self._entries())
+            self._write_usage(self._total_bytes)
+
+    def _read_usage(self):
+        try:
+            with open(self._usage_path, 'r') as f:
+                return int(json.load(f)["bytes"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_usage(self, total_bytes):
+        temp_path = f"{self._usage_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump({"bytes": total_bytes}, f)
+            os.replace(temp_path, self._usage_path)
+        except OSError:
+            pass
+
+    def key(self, chapter_body, params):
+        """
+        Returns the cache key for a chapter body (str) and a dict of pagination parameters.
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(chapter_body.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        """
+        Returns the cached (pages, image sources) tuple for `key`, or None.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+            os.utime(path)  # Mark as recently used
+        except (OSError, ValueError, zlib.error):
+            self.misses += 1
+            return None
+        self.hits += 1
+        pages = {int(page_number): html for page_number, html in entry["pages"].items()}
+        return pages, entry["images"]
+
+    def put(self, key, pages, image_sources):
+        path = self._path(key)
+        data = zlib.compress(json.dumps({"pages": pages, "images": image_sources}).encode('utf-8'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            replaced_bytes = os.path.getsize(path)
+        except OSError:
+            replaced_bytes = 0
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        # Other processes add to the same cache, so their entries are counted from the usage file.
+        # Updates that race are lost, but every eviction recounts the folder.
+        total_bytes = self._read_usage()
+        if total_bytes is None:
+            total_bytes = self._total_bytes
+        self._total_bytes = max(0, total_bytes + len(data) - replaced_bytes)
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+        else:
+            self._write_usage(self._total_bytes)
+
+    def _entries(self):
+        for root, _, files in os.walk(self.folder):
+            for filename in files:
+                if filename.endswith(ENTRY_SUFFIX):
+                    path = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fills at most EVICT_TO of max_bytes.
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes * EVICT_TO:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._total_bytes = total
+        self._write_usage(total)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,306 @@
+import ebooklib
+from ebooklib import epub
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import telemetry
+
+from audio_store import package_soundtracks
+from bookjson import BOOK_JSON_FILENAME, BOOK_JSON_GZ_FILENAME, write_book_json
+from bookpack import PACK_FILENAME, write_pack
+from catalog import record_book
+from image_store import export_images, rewrite_chapter_images
+from image_variants import make_image_variants, record_chapter_variants
+from layout import LAYOUT_VERSION, book_image_sizes, paginate_chapter_layout
+from pagination import PAGINATION_VERSION, WORDS_PER_PAGE, paginate_chapter
+from search_index import SEARCH_DB_FILENAME, SearchIndexWriter
+
+
+class ConversionCancelled(Exception):
+    """Raised when a load or save is cancelled through its `cancel` event."""
+
+
+def _check_cancelled(cancel):
+    if cancel is not None and cancel.is_set():
+        raise ConversionCancelled()
+
+
+def _paginate_timed(paginate, *args):
+    # Runs in the pool's worker processes, whose telemetry is not collected, so the time is returned instead
+    started = time.perf_counter()
+    result = paginate(*args)
+    return result, time.perf_counter() - started
+
+
+def iter_paginated_chapters(chapter_bodies, workers=None, cache=None, progress=None, cancel=None, layout=None,
+                            chapter_names=None, image_sizes=None):
+    """
+    Paginates a list of chapter body HTML strings, yielding (pages, image sources) tuples in the same order
+    as each chapter is ready.
+
+    With `workers` greater than 1 the chapters are split across a pool of that many processes.
+    With a ChapterCache only the chapters missing from the cache are paginated.
+    `progress` is called with (message, chapters done, chapter count) as chapters finish, and
+    ConversionCancelled is raised between chapters once the `cancel` event is set.
+
+    With a LayoutProfile as `layout`, pages are filled to the reader's page height instead of
+    counting words (see layout.py). `chapter_names` (the chapters' item names) and `image_sizes`
+    (image item names to their pixel sizes) are then used to size the images.
+    """
+    chapter_names = chapter_names or [''] * len(chapter_bodies)
+    image_sizes = image_sizes or {}
+
+    def params(index):
+        if layout is None:
+            return {"version": PAGINATION_VERSION, "words_per_page": WORDS_PER_PAGE}
+        # The chapter name and image sizes decide how tall its images are
+        return {"version": PAGINATION_VERSION, "layout_version": LAYOUT_VERSION, "layout": layout.to_dict(),
+                "chapter": chapter_names[index], "images": sorted(image_sizes.items())}
+
+    cached = {}
+    keys = [None] * len(chapter_bodies)
+    if cache is not None:
+        for index, body in enumerate(chapter_bodies):
+            keys[index] = cache.key(body, params(index))
+            result = cache.get(keys[index])
+            if result is not None:
+                cached[index] = result
+        telemetry.count("chapter cache hits", len(cached))
+        telemetry.count("chapter cache misses", len(chapter_bodies) - len(cached))
+
+    missing = [index for index in range(len(chapter_bodies)) if index not in cached]
+    if layout is None:
+        paginate = paginate_chapter
+        arguments = [[chapter_bodies[index] for index in missing]]
+    else:
+        paginate = paginate_chapter_layout
+        arguments = [[chapter_bodies[index] for index in missing], [layout] * len(missing),
+                     [image_sizes] * len(missing), [chapter_names[index] for index in missing]]
+    arguments.insert(0, [paginate] * len(missing))
+    done = len(cached)
+    if progress:
+        progress("Paginating chapters", done, len(chapter_bodies))
+
+    executor = None
+    if not workers or workers < 2 or len(missing) < 2:
+        paginated = map(_paginate_timed, *arguments)
+    else:
+        chunksize = max(1, len(missing) // (workers * 4))
+        executor = ProcessPoolExecutor(max_workers=workers)
+        paginated = executor.map(_paginate_timed, *arguments, chunksize=chunksize)
+
+    try:
+        for index in range(len(chapter_bodies)):
+            if index in cached:
+                yield cached.pop(index)
+                continue
+            result, seconds = next(paginated)
+            telemetry.record("paginate", seconds, chapter=index)
+            if cache is not None:
+                cache.put(keys[index], *result)
+            done += 1
+            if progress:
+                progress("Paginating chapters", done, len(chapter_bodies))
+            _check_cancelled(cancel)
+            yield result
+    finally:
+        if executor is not None:
+            # Also reached when cancelled or when the consumer stops early
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def paginate_chapters(chapter_bodies, workers=None, cache=None, progress=None, cancel=None, layout=None,
+                      chapter_names=None, image_sizes=None):
+    """
+    Paginates a list of chapter body HTML strings, returning (pages, image sources) tuples in the same order.
+    See iter_paginated_chapters for the parameters.
+    """
+    return list(iter_paginated_chapters(chapter_bodies, workers, cache, progress, cancel, layout, chapter_names,
+                                        image_sizes))
+
+
+def read_epub(file_path, progress=None, cancel=None):
+    """
+    Reads an EPUB file without paginating it.
+
+    Returns a tuple of the book dict (title, author, soundtracks) without its chapters, the
+    document items that make up the chapters, and a dict of image item names to their raw bytes.
+    """
+    if progress:
+        progress("Reading ePub", 0, 1)
+    with telemetry.timer("read epub"):
+        book = epub.read_epub(file_path)
+    _check_cancelled(cancel)
+    book_json = {
+        "title": book.get_metadata('DC', 'title')[0][0],
+        "author": book.get_metadata('DC', 'creator')[0][0],
+        "soundtracks": {},  # Store all soundtracks globally
+    }
+
+    # Extract images and store them
+    book_images = {}
+    for item in book.get_items():
+        if item.get_type() in (ebooklib.ITEM_IMAGE, ebooklib.ITEM_COVER):
+            book_images[item.get_name()] = item.content
+
+    return book_json, list(book.get_items_of_type(ebooklib.ITEM_DOCUMENT)), book_images
+
+
+def iter_chapters(items, workers=None, cache=None, progress=None, cancel=None, layout=None, image_sizes=None):
+    """
+    Yields the chapter dict (title, text, images) of every document item as soon as it is paginated.
+    See iter_paginated_chapters for the parameters.
+    """
+    chapter_bodies = [item.get_body_content().decode('utf-8') for item in items]
+    chapter_names = [item.get_name() for item in items]
+    paginated = iter_paginated_chapters(chapter_bodies, workers, cache, progress, cancel, layout, chapter_names,
+                                        image_sizes)
+    for item, (chapter_text, image_sources) in zip(items, paginated):
+        images_dict = {idx + 1: src for idx, src in enumerate(image_sources)}
+        yield {
+            "title": item.get_name() if item.get_name() else "Untitled Chapter",
+            "text": chapter_text,
+            "images": images_dict,
+        }
+
+
+def parse_epub(file_path, workers=None, cache=None, progress=None, cancel=None, layout=None):
+    """
+    Reads an EPUB file and paginates every document item, optionally across `workers` processes
+    and reusing chapters found in a ChapterCache. `progress`, `cancel` and the `layout` profile
+    are passed on to iter_paginated_chapters.
+
+    Returns a tuple of the book dict (title, author, soundtracks, chapters) and a
+    dict of image item names to their raw bytes.
+    """
+    book_json, items, book_images = read_epub(file_path, progress, cancel)
+    image_sizes = book_image_sizes(book_images) if layout is not None else None
+    book_json["chapters"] = list(iter_chapters(items, workers, cache, progress, cancel, layout, image_sizes))
+    return book_json, book_images
+
+
+def paginate_text(text_data):
+    """
+    Splits chapter HTML into pages of up to 555 words, returning a dict of page number to HTML.
+    """
+    pages, _ = paginate_chapter(text_data)
+    return pages
+
+
+def book_output_folder(folder_path, title):
+    return os.path.join(folder_path, f'{title.replace(" ","")}conversion')
+
+
+def save_book(book_json, book_images, folder_path, library_folder=None, book_format="json", progress=None, cancel=None,
+              image_variants=True, webp=False, image_workers=None, search_index=True, package_audio=True,
+              audio_bitrate=None, catalog=True):
+    """
+    Writes a converted book to '<folder_path>/<Title>conversion/' as book.json (or book.pack) plus a
+    content-addressed images folder. Chapters are written one at a time, so book_json["chapters"] may
+    be a generator such as iter_chapters, and the book is then never held in memory as a whole.
+
+    Parameters:
+    - book_json (dict): Book dict as returned by parse_epub. Its image paths are rewritten in place.
+    - book_images (dict): Image names mapped to their bytes, as returned by parse_epub.
+    - folder_path (str): Folder in which the book's conversion folder is created.
+    - library_folder (str): Optional image library shared between books, see image_store.export_images.
+    - book_format (str): "json" for an indented book.json, "compact" for a book.json without whitespace,
+      "gzip" for a compact, gzip-compressed book.json.gz (see bookjson), or "pack" for a lazily
+      loadable book.pack (see bookpack).
+    - progress (callable): Optional, called with (message, steps done, step count) between steps.
+    - cancel (threading.Event): Optional. Once set, ConversionCancelled is raised before the book file is written.
+    - image_variants (bool): Also write display-sized and thumbnail copies of large images, see image_variants.
+    - webp (bool): Write those copies as WebP.
+    - image_workers (int): Processes used to make the copies (default: CPU count).
+    - search_index (bool): Also write a full-text search index of the pages, see search_index. Without
+      it, an index written by an earlier save is removed.
+    - package_audio (bool): Copy the soundtracks into the book's audio folder and measure their
+      loudness, see audio_store. book_json["soundtracks"] itself keeps the original paths.
+    - audio_bitrate (int): Optional bitrate in kbit/s the soundtracks are transcoded to.
+    - catalog (bool): Record the book in folder_path's library catalog, see catalog.
+
+    Returns the path of the written book file.
+    """
+    output_folder = book_output_folder(folder_path, book_json["title"])
+    os.makedirs(output_folder, exist_ok=True)
+
+    # Store the book's images and point the chapters at them
+    if progress:
+        progress("Storing images", 0, 4)
+    with telemetry.timer("store images"):
+        stored_images = export_images(book_images, output_folder, library_folder)
+    _check_cancelled(cancel)
+    variants = {}
+    if image_variants:
+        if progress:
+            progress("Resizing images", 1, 4)
+        with telemetry.timer("image variants"):
+            variants = make_image_variants(stored_images.values(), output_folder, webp, image_workers)
+        _check_cancelled(cancel)
+
+    book_metadata = dict(book_json)
+    if package_audio:
+        if progress:
+            progress("Storing soundtracks", 2, 4)
+        with telemetry.timer("store soundtracks"):
+            book_metadata["soundtracks"], book_metadata["audio"] = package_soundtracks(
+                book_json["soundtracks"], output_folder, audio_bitrate)
+        _check_cancelled(cancel)
+
+    search_db_path = os.path.join(output_folder, SEARCH_DB_FILENAME)
+    search_writer = SearchIndexWriter(search_db_path) if search_index else None
+
+    page_counts = []
+    covers = []
+
+    def rewritten_chapters():
+        for chapter_number, chapter in enumerate(book_json["chapters"]):
+            rewrite_chapter_images(chapter, stored_images)
+            record_chapter_variants(chapter, variants)
+            page_counts.append(len(chapter["text"]))
+            if not covers and chapter["images"]:
+                covers.append(next(iter(chapter["images"].values())))
+            if search_writer:
+                search_writer.add_chapter(chapter_number, chapter)
+            yield chapter
+
+    if progress:
+        progress("Writing book", 3, 4)
+    try:
+        with telemetry.timer("write book", format=book_format):
+            book_file = _write_book_file(dict(book_metadata, chapters=rewritten_chapters()), output_folder, book_format)
+    except BaseException:
+        if search_writer:
+            search_writer.abort()
+        raise
+    if search_writer:
+        with telemetry.timer("search index"):
+            search_writer.close()
+    elif os.path.exists(search_db_path):
+        # An index from an earlier save would find pages this book no longer has
+        os.remove(search_db_path)
+    if catalog:
+        try:
+            record_book(folder_path, output_folder, book_metadata, page_counts, book_file, covers[0] if covers else None)
+        except sqlite3.Error as e:
+            print(f"Could not add {book_json['title']} to the library catalog: {e}")
+    return book_file
+
+
+def _write_book_file(book_json, output_folder, book_format):
+    if book_format == "pack":
+        book_file = write_pack(book_json, os.path.join(output_folder, PACK_FILENAME))
+    elif book_format == "gzip":
+        book_file = write_book_json(book_json, os.path.join(output_folder, BOOK_JSON_GZ_FILENAME))
+    else:
+        indent = None if book_format == "compact" else 4
+        book_file = write_book_json(book_json, os.path.join(output_folder, BOOK_JSON_FILENAME), indent)
+    # The reader picks book.pack, then book.json.gz, then book.json, so a book file left from an
+    # earlier save in another format would be shown instead of this one
+    for filename in (PACK_FILENAME, BOOK_JSON_GZ_FILENAME, BOOK_JSON_FILENAME):
+        stale_file = os.path.join(output_folder, filename)
+        if os.path.abspath(stale_file) != os.path.abspath(book_file) and os.path.exists(stale_file):
+            os.remove(stale_file)
+    return book_file
@@ -0,0 +1,268 @@
+"""
+Headless batch conversion of ePub files into the book.json layout written by createbook.py.
+
+Usage:
+    python convert.py BOOKS... --output FOLDER [--soundtracks MANIFEST] [--workers N] [--chapter-workers N] [--timeout SECONDS]
+
+BOOKS may be ePub files, directories (every *.epub inside is converted) or glob patterns.
+The soundtrack manifest is a JSON file mapping an ePub file name (with or without the
+.epub extension) to a dict of "start-end" page ranges and MP3 paths, the same shape as
+book_json["soundtracks"].
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+
+import conversion
+import telemetry
+from chapter_cache import DEFAULT_CACHE_FOLDER, DEFAULT_MAX_BYTES, ChapterCache
+from layout import DEFAULT_PROFILE_PATH, LayoutProfile, book_image_sizes
+
+
+def find_epubs(inputs):
+    """
+    Expands files, directories and glob patterns into a sorted, de-duplicated list of ePub paths.
+    """
+    epub_files = []
+    for entry in inputs:
+        if os.path.isdir(entry):
+            matches = glob.glob(os.path.join(entry, '*.epub'))
+        elif os.path.isfile(entry):
+            matches = [entry]
+        else:
+            matches = glob.glob(entry, recursive=True)
+        for match in matches:
+            if match.lower().endswith('.epub') and os.path.isfile(match):
+                epub_files.append(os.path.abspath(match))
+    return sorted(set(epub_files))
+
+
+def load_soundtrack_manifest(manifest_path):
+    if not manifest_path:
+        return {}
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+    if not isinstance(manifest, dict):
+        raise ValueError("Soundtrack manifest must be a JSON object keyed by ePub file name.")
+    return manifest
+
+
+def soundtracks_for(manifest, epub_file_path):
+    filename = os.path.basename(epub_file_path)
+    stem = os.path.splitext(filename)[0]
+    return manifest.get(filename, manifest.get(stem, {}))
+
+
+def convert_book(epub_file_path, output_folder, soundtracks, chapter_workers=None, cache=None, image_library=None,
+                 book_format="json", save_options=None, layout=None):
+    """
+    Converts a single ePub and returns the path of the written book file.
+
+    Chapters are written as they are paginated rather than collected first. `save_options`
+    are passed to conversion.save_book as keyword arguments (image_variants, webp, image_workers,
+    search_index, package_audio, audio_bitrate). With a LayoutProfile as `layout` the pages are fitted to the reader's page.
+    """
+    book_json, items, book_images = conversion.read_epub(epub_file_path)
+    book_json["soundtracks"] = dict(soundtracks)
+    image_sizes = book_image_sizes(book_images) if layout is not None else None
+    book_json["chapters"] = conversion.iter_chapters(items, chapter_workers, cache, layout=layout, image_sizes=image_sizes)
+    return conversion.save_book(book_json, book_images, output_folder, image_library, book_format, **(save_options or {}))
+
+
+def _convert_worker(epub_file_path, output_folder, soundtracks, chapter_workers, cache_options, image_library,
+                    book_format, save_options, layout, results):
+    if hasattr(os, "setpgrp"):
+        # A process group of its own, so that _stop_worker also stops the chapter, image and
+        # ffmpeg processes this worker starts
+        os.setpgrp()
+    # Only this book's timings are sent back, not those the worker inherited from the main process
+    telemetry.reset()
+    cache = ChapterCache(*cache_options) if cache_options else None
+    try:
+        book_file = convert_book(epub_file_path, output_folder, soundtracks, chapter_workers, cache,
+                                        image_library, book_format, save_options, layout)
+        status, detail = "ok", book_file
+    except Exception as e:
+        status, detail = "failed", f"{type(e).__name__}: {e}"
+    results.put((epub_file_path, status, detail, cache.stats() if cache else None,
+                 telemetry.snapshot() if telemetry.enabled else None))
+
+
+def _stop_worker(process):
+    """
+    Terminates a book worker together with every process it started, and waits for it.
+    """
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            process.terminate()  # Stopped before it made its process group, so it has no children yet
+    else:
+        process.terminate()
+    process.join()
+
+
+def convert_all(epub_files, output_folder, manifest=None, workers=None, timeout=None, chapter_workers=None,
+                cache_options=None, image_library=None, book_format="json", save_options=None, layout=None):
+    """
+    Converts every ePub in its own worker process, running at most `workers` at once.
+
+    A book that raises, crashes its process or runs longer than `timeout` seconds is
+    recorded as failed without affecting the others. `chapter_workers` additionally
+    paginates the chapters of each book in a pool of that many processes.
+    `cache_options` is a (folder, max_bytes) tuple for the shared ChapterCache, or None.
+    `image_library` is an optional folder in which images are deduplicated across books.
+    `book_format` is "json", "compact", "gzip" or "pack", see conversion.save_book.
+    `save_options` controls the image variants, search index and soundtracks, see convert_book.
+    `layout` is the LayoutProfile pages are fitted to, or None to paginate by word count.
+
+    Returns a list of result dicts (epub, status, detail, seconds, cache) in input order. While
+    telemetry is enabled, the timings and counters of every book worker are merged into this process.
+    """
+    manifest = manifest or {}
+    workers = workers or os.cpu_count() or 1
+    results = multiprocessing.Queue()
+    pending = list(epub_files)
+    running = {}
+    finished = {}
+
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                epub_file_path = pending.pop(0)
+                process = multiprocessing.Process(
+                    target=_convert_worker,
+                    args=(epub_file_path, output_folder, soundtracks_for(manifest, epub_file_path), chapter_workers,
+                          cache_options, image_library, book_format, save_options, layout, results),
+                )
+                process.start()
+                running[epub_file_path] = (process, time.monotonic())
+
+            # Every queued result is read before the timeouts are checked, so a book that finished
+            # is never reported as timed out
+            received = []
+            try:
+                received.append(results.get(timeout=0.1))
+                while True:
+                    received.append(results.get_nowait())
+            except queue.Empty:
+                pass
+            for epub_file_path, status, detail, cache_stats, recorded in received:
+                if epub_file_path not in running:
+                    continue  # Already reported as timed out or failed
+                process, started = running.pop(epub_file_path)
+                process.join()
+                if recorded:
+                    telemetry.merge(recorded)
+                finished[epub_file_path] = (status, detail, time.monotonic() - started, cache_stats)
+                print(f"[{status}] {epub_file_path}")
+
+            now = time.monotonic()
+            for epub_file_path, (process, started) in list(running.items()):
+                if timeout is not None and now - started > timeout:
+                    _stop_worker(process)
+                    detail = f"Timed out after {timeout} seconds"
+                    status = "timeout"
+                elif not process.is_alive() and process.exitcode != 0:
+                    _stop_worker(process)  # Its pools may have outlived it
+                    detail = f"Worker exited with code {process.exitcode}"
+                    status = "failed"
+                else:
+                    continue
+                del running[epub_file_path]
+                finished[epub_file_path] = (status, detail, now - started, None)
+                print(f"[{status}] {epub_file_path}")
+    finally:
+        # On Ctrl+C the workers, being in their own process groups, do not get the interrupt
+        for process, _ in running.values():
+            _stop_worker(process)
+
+    return [
+        {
+            "epub": path,
+            "status": finished[path][0],
+            "detail": finished[path][1],
+            "seconds": round(finished[path][2], 3),
+            "cache": finished[path][3],
+        }
+        for path in epub_files
+    ]
+
+
+def print_summary(results):
+    converted = [r for r in results if r["status"] == "ok"]
+    failed = [r for r in results if r["status"] != "ok"]
+    total_seconds = sum(r["seconds"] for r in results)
+    print(f"\nConverted {len(converted)} of {len(results)} books ({total_seconds:.1f}s of worker time).")
+    cache_results = [r["cache"] for r in results if r["cache"]]
+    if cache_results:
+        hits = sum(stats["hits"] for stats in cache_results)
+        misses = sum(stats["misses"] for stats in cache_results)
+        print(f"Chapter cache: {hits} hits, {misses} misses.")
+    for result in failed:
+        print(f"  {result['status'].upper()}: {result['epub']} - {result['detail']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert ePub files to JSON books without the GUI.")
+    parser.add_argument("inputs", nargs="+", help="ePub files, directories or glob patterns")
+    parser.add_argument("-o", "--output", required=True, help="folder in which each <Title>conversion folder is created")
+    parser.add_argument("-s", "--soundtracks", help="JSON manifest of soundtracks per ePub file name")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of books converted at once (default: CPU count)")
+    parser.add_argument("-t", "--timeout", type=float, default=None, help="seconds before a single book is abandoned")
+    parser.add_argument("--chapter-workers", type=int, default=None, help="processes used to paginate the chapters of one book (default: 1)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_FOLDER, help="folder of the paginated chapter cache")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), help="maximum chapter cache size in MB")
+    parser.add_argument("--no-cache", action="store_true", help="paginate every chapter without using the cache")
+    parser.add_argument("--image-library", help="folder in which images are stored once and shared between books")
+    parser.add_argument("--format", choices=["json", "compact", "gzip", "pack"], default="json",
+                        help="write an indented book.json, a compact book.json, a gzip-compressed book.json.gz, "
+                             "or a lazily loadable book.pack")
+    parser.add_argument("--no-image-variants", action="store_true", help="do not write display-sized and thumbnail copies of large images")
+    parser.add_argument("--webp", action="store_true", help="write the image copies as WebP")
+    parser.add_argument("--image-workers", type=int, default=None, help="processes used to resize the images of one book (default: CPU count)")
+    parser.add_argument("--no-search-index", action="store_true", help="do not write the full-text search index")
+    parser.add_argument("--no-audio-copy", action="store_true",
+                        help="keep the soundtracks' original paths instead of copying them into the book folder")
+    parser.add_argument("--audio-bitrate", type=int, default=None, metavar="KBPS",
+                        help="transcode the copied soundtracks to MP3 at this bitrate (needs ffmpeg)")
+    parser.add_argument("--layout", nargs="?", const=DEFAULT_PROFILE_PATH, metavar="PROFILE",
+                        help="fill each page to the reader's page height, using the layout profile the reader "
+                             f"saved (default: {DEFAULT_PROFILE_PATH}) instead of 555-word pages")
+    parser.add_argument("--report", help="write the summary report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    epub_files = find_epubs(args.inputs)
+    if not epub_files:
+        print("No ePub files found.")
+        return 1
+
+    manifest = load_soundtrack_manifest(args.soundtracks)
+    os.makedirs(args.output, exist_ok=True)
+
+    cache_options = None if args.no_cache else (args.cache_dir, args.cache_size * 1024 * 1024)
+    save_options = {"image_variants": not args.no_image_variants, "webp": args.webp, "image_workers": args.image_workers,
+                    "search_index": not args.no_search_index, "package_audio": not args.no_audio_copy,
+                    "audio_bitrate": args.audio_bitrate}
+    layout = LayoutProfile.load(args.layout) if args.layout else None
+    results = convert_all(epub_files, args.output, manifest, args.workers, args.timeout, args.chapter_workers,
+                          cache_options, args.image_library, args.format, save_options, layout)
+    print_summary(results)
+    if telemetry.enabled:
+        print("\n" + telemetry.format_stats())
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    return 0 if all(r["status"] == "ok" for r in results) else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,42 +1,24 @@
-import ebooklib
-from ebooklib import epub
-import json
-import os
+import queue
+import threading
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
 from tkinter.scrolledtext import ScrolledText
 from tkinterhtml import HtmlFrame
 from bs4 import BeautifulSoup
-import shutil
-import zipfile
+import conversion
+import telemetry
+from chapter_cache import ChapterCache
+from layout import LayoutProfile
+from page_index import PageIndex
+from soundtrack_index import SoundtrackIndex, add_track, parse_range
 
 allowed_chars = "1234567890-"
+POLL_INTERVAL_MS = 100  # How often the Tk loop checks for messages from the worker thread
+STATS_INTERVAL_MS = 500  # How often the open stats panel is refreshed
 
 def validate(char, entry_value):
     return char in allowed_chars
 
-def extract_images_from_epub(epub_file_path, output_folder):
-    """
-    Extracts images from an EPUB file located in any path containing 'images/' and saves them to the specified output folder.
-
-    Parameters:
-    - epub_file_path (str): Path to the EPUB file.
-    - output_folder (str): Folder where extracted images will be saved.
-    """
-    try:
-        with zipfile.ZipFile(epub_file_path, 'r') as epub_zip:
-            for file_info in epub_zip.infolist():
-                if 'images/' in file_info.filename and not file_info.is_dir():
-                    # Extract image file
-                    filename = os.path.basename(file_info.filename)
-                    output_path = os.path.join(output_folder, filename)
-                    with epub_zip.open(file_info) as source, open(output_path, 'wb') as target:
-                        shutil.copyfileobj(source, target)
-                    print(f"Extracted: {filename} to {output_path}")
-        print("Extraction completed successfully!")
-    except Exception as e:
-        print(f"Error extracting images from EPUB: {str(e)}")
-
 class EPUBToJSONConverter(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -48,6 +30,13 @@ class EPUBToJSONConverter(tk.Tk):
         self.current_page = 0
         self.current_chapter = 0
         self.book_images = {}
+        self.chapter_cache = ChapterCache()
+        self.soundtrack_index = SoundtrackIndex()
+        self.page_index = PageIndex()
+        # Loading and saving run on a worker thread that reports back through this queue
+        self.worker = None
+        self.worker_messages = queue.Queue()
+        self.cancel_event = threading.Event()
 
         # Create GUI elements
         self.text_widget = ScrolledText(self, wrap='word', state='disabled')
@@ -59,6 +48,11 @@ class EPUBToJSONConverter(tk.Tk):
         self.load_button = tk.Button(self, text="Load ePub", command=self.load_epub)
         self.load_button.pack(side=tk.RIGHT, padx=10, pady=10)
 
+        # Fill pages to the reader's page height (measured by the reader) instead of 555 words
+        self.fit_pages = tk.BooleanVar(value=False)
+        self.fit_pages_checkbox = tk.Checkbutton(self, text="Fit pages to reader", variable=self.fit_pages)
+        self.fit_pages_checkbox.pack(side=tk.RIGHT, padx=10, pady=10)
+
         self.add_soundtrack_button = tk.Button(self, text="Add Soundtrack", command=self.add_soundtrack, state=tk.DISABLED)
         self.add_soundtrack_button.pack(side=tk.LEFT, padx=10, pady=10)
 
@@ -82,6 +76,30 @@ class EPUBToJSONConverter(tk.Tk):
         self.page_number_label = tk.Label(self, text="Page: 1")
         self.page_number_label.pack(side=tk.LEFT, padx=10, pady=10)
 
+        # Jump to a global page number
+        self.go_to_page_entry = tk.Entry(self, width=8, validate='key', validatecommand=vcmd)
+        self.go_to_page_entry.pack(side=tk.LEFT, padx=10, pady=10)
+        self.go_to_page_entry.bind('<Return>', lambda event: self.go_to_page())
+
+        self.go_to_page_button = tk.Button(self, text="Go to Page", command=self.go_to_page, state=tk.DISABLED)
+        self.go_to_page_button.pack(side=tk.LEFT, padx=10, pady=10)
+
+        # Progress of the running load or save
+        self.cancel_button = tk.Button(self, text="Cancel", command=self.cancel_work, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.RIGHT, padx=10, pady=10)
+
+        self.progress_bar = ttk.Progressbar(self, length=200, mode='determinate')
+        self.progress_bar.pack(side=tk.RIGHT, padx=10, pady=10)
+
+        self.progress_label = tk.Label(self, text="")
+        self.progress_label.pack(side=tk.RIGHT, padx=10, pady=10)
+
+        # Live timings and counters, see telemetry.py
+        self.stats_window = None
+        self.stats_refresh = None  # after() id of the next stats panel refresh
+        self.stats_button = tk.Button(self, text="Stats", command=self.show_stats)
+        self.stats_button.pack(side=tk.RIGHT, padx=10, pady=10)
+
         # Initialize HtmlFrame
         self.html_frame = HtmlFrame(self, horizontal_scrollbar="auto")
         self.html_frame.pack(expand=True, fill=tk.BOTH)
@@ -89,83 +107,101 @@ class EPUBToJSONConverter(tk.Tk):
     def load_epub(self):
         file_path = filedialog.askopenfilename(filetypes=[("ePub files", "*.epub")])
         if file_path:
-            self.current_file_path = file_path
-            self.book_json = self.parse_epub(file_path)
-            self.current_page = 0
-            self.current_chapter = 0
-            self.display_book()
-            self.add_soundtrack_button.config(state=tk.NORMAL)
-            self.save_button.config(state=tk.NORMAL)
-            self.prev_page_button.config(state=tk.NORMAL)
-            self.next_page_button.config(state=tk.NORMAL)
-            self.prev_chapter_button.config(state=tk.NORMAL)
-            self.next_chapter_button.config(state=tk.NORMAL)
-            self.update_page_number_display()
-
-    def parse_epub(self, file_path):
-        book = epub.read_epub(file_path)
-        book_json = {
-            "title": book.get_metadata('DC', 'title')[0][0],
-            "author": book.get_metadata('DC', 'creator')[0][0],
-            "soundtracks": {},  # Store all soundtracks globally
-            "chapters": []
-        }
-
-        for item in book.get_items_of_type(ebooklib.ITEM_DOCUMENT):
-            soup = BeautifulSoup(item.get_body_content().decode('utf-8'), 'html.parser')
-            text_data = str(soup)
-            chapter_text = self.paginate_text(text_data)
-            images_dict = {idx + 1: img['src'] for idx, img in enumerate(soup.find_all('img'))}
-            chapter = {
-                "title": item.get_name() if item.get_name() else "Untitled Chapter",
-                "text": chapter_text,
-                "images": images_dict,
-            }
-            book_json["chapters"].append(chapter)
-
-        # Extract images and store them
-        self.book_images = {}
-        for item in book.get_items_of_type(ebooklib.ITEM_IMAGE):
-            self.book_images[item.get_name()] = item.content
-
-        return book_json
+            layout = LayoutProfile.load() if self.fit_pages.get() else None
+            # The current book stays browsable while the new one is parsed
+            self.start_work(self.parse_epub, file_path, layout)
+
+    def book_loaded(self, file_path, book_json, book_images):
+        self.current_file_path = file_path
+        self.book_json = book_json
+        self.book_images = book_images
+        self.soundtrack_index = SoundtrackIndex(self.book_json["soundtracks"])
+        self.page_index = PageIndex.from_chapters(self.book_json["chapters"])
+        self.current_page = 0
+        self.current_chapter = 0
+        self.display_book()
+        self.add_soundtrack_button.config(state=tk.NORMAL)
+        self.save_button.config(state=tk.NORMAL)
+        self.prev_page_button.config(state=tk.NORMAL)
+        self.next_page_button.config(state=tk.NORMAL)
+        self.prev_chapter_button.config(state=tk.NORMAL)
+        self.next_chapter_button.config(state=tk.NORMAL)
+        self.go_to_page_button.config(state=tk.NORMAL)
+        self.update_page_number_display()
 
-    def paginate_text(self, text_data):
-        soup = BeautifulSoup(text_data, 'html.parser')
-        paragraphs_and_images = soup.find_all(['p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'img'])
-        pages = {}
-        current_page = 1
-        current_content = []
-        current_word_count = 0
-
-        for item in paragraphs_and_images:
-            if item.name == 'img':
-                # Handle images
-                img_src = item.get('src')
-                if img_src:
-                    # Store image in current page
-                    current_content.append(str(item))
-                    pages[current_page] = ''.join(current_content)
-                    current_content = []
-                    current_word_count = 0
-                    current_page += 1
+    def parse_epub(self, file_path, layout):
+        # Runs on the worker thread
+        with telemetry.timer("load book"):
+            book_json, book_images = conversion.parse_epub(file_path, cache=self.chapter_cache,
+                                                           progress=self.report_progress, cancel=self.cancel_event,
+                                                           layout=layout)
+        return self.book_loaded, (file_path, book_json, book_images)
+
+    def start_work(self, task, *args):
+        """
+        Runs task(*args) on a worker thread. The task returns a (callback, args) pair that is
+        called on the Tk thread once it finishes.
+        """
+        self.cancel_event.clear()
+        self.set_busy(True)
+        self.worker = threading.Thread(target=self.run_work, args=(task, args), daemon=True)
+        self.worker.start()
+        self.after(POLL_INTERVAL_MS, self.poll_worker)
+
+    def run_work(self, task, args):
+        # Tk widgets must only be touched from the main thread, so everything goes through the queue
+        try:
+            self.worker_messages.put(("done", task(*args)))
+        except conversion.ConversionCancelled:
+            self.worker_messages.put(("cancelled", None))
+        except Exception as e:
+            self.worker_messages.put(("error", str(e)))
+
+    def report_progress(self, message, done, total):
+        # Runs on the worker thread
+        self.worker_messages.put(("progress", (message, done, total)))
+
+    def poll_worker(self):
+        finished = False
+        while True:
+            try:
+                kind, payload = self.worker_messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                message, done, total = payload
+                self.progress_label.config(text=message)
+                self.progress_bar.config(maximum=max(total, 1), value=done)
+                continue
+            finished = True
+            self.set_busy(False)
+            if kind == "done":
+                callback, callback_args = payload
+                callback(*callback_args)
+            elif kind == "cancelled":
+                self.progress_label.config(text="Cancelled")
             else:
-                # Handle paragraphs and other elements
-                paragraph_text = item.get_text()
-                word_count = len(paragraph_text.split())
-                if current_word_count + word_count > 555:
-                    pages[current_page] = ''.join(current_content)
-                    current_page += 1
-                    current_content = []
-                    current_word_count = 0
-                current_content.append(str(item))
-                current_word_count += word_count
-
-        if current_content:
-            pages[current_page] = ''.join(current_content)
-
-        return pages
+                messagebox.showerror("Error", payload)
+        if not finished:
+            self.after(POLL_INTERVAL_MS, self.poll_worker)
+
+    def set_busy(self, busy):
+        self.progress_bar.config(value=0)
+        self.progress_label.config(text="")
+        self.cancel_button.config(state=tk.NORMAL if busy else tk.DISABLED)
+        self.load_button.config(state=tk.DISABLED if busy else tk.NORMAL)
+        self.fit_pages_checkbox.config(state=tk.DISABLED if busy else tk.NORMAL)
+        # The book being saved must not change underneath the worker
+        book_state = tk.DISABLED if busy or not self.book_json else tk.NORMAL
+        self.save_button.config(state=book_state)
+        self.add_soundtrack_button.config(state=book_state)
+
+    def cancel_work(self):
+        self.cancel_event.set()
+        self.progress_label.config(text="Cancelling...")
 
+    def paginate_text(self, text_data):
+        return conversion.paginate_text(text_data)
 
     def display_book(self):
         self.text_widget.config(state='normal')
@@ -175,6 +211,12 @@ class EPUBToJSONConverter(tk.Tk):
         self.text_widget.config(state='disabled')
 
     def show_page(self):
+        with telemetry.timer("show page"):
+            self.render_page()
+        # Update page number display
+        self.update_page_number_display()
+
+    def render_page(self):
         current_chapter = self.book_json["chapters"][self.current_chapter]
         pages = current_chapter["text"]
         page_content = pages.get(self.current_page + 1, "")
@@ -191,9 +233,6 @@ class EPUBToJSONConverter(tk.Tk):
         # Set HTML content in HtmlFrame
         self.html_frame.set_content(page_content)
 
-        # Update page number display
-        self.update_page_number_display()
-
     def show_previous_page(self):
         if self.current_page > 0:
             self.current_page -= 1
@@ -226,44 +265,46 @@ class EPUBToJSONConverter(tk.Tk):
             self.current_page = 0
             self.display_book()
 
+    def go_to_page(self):
+        if not self.book_json:
+            return
+        try:
+            page_number = int(self.go_to_page_entry.get().strip())
+            chapter, local_page = self.page_index.locate(page_number)
+        except (ValueError, IndexError):
+            messagebox.showerror("Invalid Input", f"Please enter a page number between 1 and {self.page_index.page_count}.")
+            return
+        self.current_chapter = chapter
+        self.current_page = local_page - 1
+        self.display_book()
+
     def add_soundtrack(self):
         page_range = self.page_number_entry.get().strip()
         if '-' not in page_range:
             messagebox.showerror("Invalid Input", "Please enter a valid page range (e.g., 1-5).")
             return
 
-        start_page, end_page = page_range.split('-')
         try:
-            start_page = int(start_page)
-            end_page = int(end_page)
+            start_page, end_page = parse_range(page_range)
         except ValueError:
             messagebox.showerror("Invalid Input", "Page numbers must be integers.")
             return
         
-        max_page = 0
-        for chapter in self.book_json["chapters"]:
-            max_page += len(chapter["text"])
+        max_page = self.page_index.page_count
 
         if start_page > end_page or start_page < 1 or end_page > max_page:
             messagebox.showerror("Invalid Input", f"Invalid page range. Please enter a range between 1 and {max_page}.")
             return
 
-        # Check for overlap with existing soundtracks
-        overlap_detected = False
-        for existing_range in self.book_json["soundtracks"]:
-            existing_start, existing_end = map(int, existing_range.split('-'))
-            if not (end_page < existing_start or start_page > existing_end):
-                overlap_detected = True
-                break
-
-        if overlap_detected:
-            messagebox.showerror("Overlap Detected", "Song overlapping is not supported at the moment. Please select a non-overlapping range.")
-            return
+        # Check for overlap with existing soundtracks; overlapping tracks are layered
+        if self.soundtrack_index.overlaps(start_page, end_page):
+            if not messagebox.askyesno("Overlap Detected", "This range overlaps an existing soundtrack. Play the new track layered on top of it?"):
+                return
 
         mp3_file = filedialog.askopenfilename(filetypes=[("MP3 files", "*.mp3")])
         if mp3_file:
-            soundtrack_key = f"{start_page}-{end_page}"
-            self.book_json["soundtracks"][soundtrack_key] = mp3_file
+            add_track(self.book_json["soundtracks"], start_page, end_page, mp3_file)
+            self.soundtrack_index = SoundtrackIndex(self.book_json["soundtracks"])
             messagebox.showinfo("Success", "Soundtrack added successfully!")
 
     
@@ -274,43 +315,64 @@ class EPUBToJSONConverter(tk.Tk):
 
         folder_path = filedialog.askdirectory()
         if folder_path:
-            title = self.book_json["title"]
-            output_folder = os.path.join(folder_path, f'{title.replace(" ","")}conversion')
-            os.makedirs(output_folder, exist_ok=True)
-
-            # Extract images from EPUB to the output_folder
-            epub_file_path = self.current_file_path  # Assuming current_file_path is set correctly
-            images_folder = os.path.join(output_folder, 'images')
-            os.makedirs(images_folder, exist_ok=True)
-            extract_images_from_epub(epub_file_path, images_folder)
-
-            # Update image paths in the JSON
-            for chapter in self.book_json["chapters"]:
-                updated_images = {}
-                for page_number, img_path in chapter["images"].items():
-                    img_filename = os.path.basename(img_path)
-                    updated_images[page_number] = os.path.join('images', img_filename)
-                chapter["images"] = updated_images
+            self.start_work(self.save_book, self.book_json, self.book_images, folder_path)
 
-            # Save the updated book JSON to a file
-            json_output_file = os.path.join(output_folder, 'book.json')
-            with open(json_output_file, 'w') as f:
-                json.dump(self.book_json, f, indent=4)
+    def save_book(self, book_json, book_images, folder_path):
+        # Runs on the worker thread
+        with telemetry.timer("save book"):
+            json_output_file = conversion.save_book(book_json, book_images, folder_path,
+                                                    progress=self.report_progress, cancel=self.cancel_event)
+        return self.book_saved, (json_output_file,)
 
-            messagebox.showinfo("Success", f"JSON file saved successfully in {json_output_file}")
+    def book_saved(self, json_output_file):
+        messagebox.showinfo("Success", f"JSON file saved successfully in {json_output_file}")
 
 
-    def update_page_number_display(self):
-        total_pages = 0
+    def show_stats(self):
+        if self.stats_window is not None:
+            self.stats_window.lift()
+            return
+        self.stats_window = tk.Toplevel(self)
+        self.stats_window.title("Performance")
+        self.stats_window.protocol("WM_DELETE_WINDOW", self.close_stats)
+        self.telemetry_enabled = tk.BooleanVar(value=telemetry.enabled)
+        tk.Checkbutton(self.stats_window, text="Collect timings", variable=self.telemetry_enabled,
+                       command=self.toggle_telemetry).pack(side=tk.TOP, anchor=tk.W, padx=10, pady=5)
+        tk.Button(self.stats_window, text="Save Trace", command=self.save_trace).pack(side=tk.TOP, anchor=tk.W, padx=10)
+        self.stats_text = tk.Text(self.stats_window, width=72, height=24, font="TkFixedFont", state='disabled')
+        self.stats_text.pack(expand=1, fill='both', padx=10, pady=10)
+        self.refresh_stats()
+
+    def refresh_stats(self):
+        if self.stats_window is None:
+            return
+        self.stats_text.config(state='normal')
+        self.stats_text.delete(1.0, tk.END)
+        self.stats_text.insert(tk.END, telemetry.format_stats())
+        self.stats_text.config(state='disabled')
+        self.stats_refresh = self.after(STATS_INTERVAL_MS, self.refresh_stats)
+
+    def toggle_telemetry(self):
+        if self.telemetry_enabled.get():
+            telemetry.enable()
+        else:
+            telemetry.disable()
 
-        # Calculate total pages from previous chapters
-        for idx in range(self.current_chapter):
-            total_pages += len(self.book_json["chapters"][idx]["text"])
+    def save_trace(self):
+        trace_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("Chrome trace", "*.json")])
+        if trace_path:
+            telemetry.dump_trace(trace_path)
 
-        # Add current page within the current chapter
-        total_pages += self.current_page + 1
+    def close_stats(self):
+        if self.stats_refresh is not None:
+            self.after_cancel(self.stats_refresh)
+            self.stats_refresh = None
+        self.stats_window.destroy()
+        self.stats_window = None
 
-        self.page_number_label.config(text=f"Page: {total_pages}")
+    def update_page_number_display(self):
+        page_number = self.page_index.to_global(self.current_chapter, self.current_page + 1)
+        self.page_number_label.config(text=f"Page: {page_number} of {self.page_index.page_count}")
 
 
 if __name__ == "__main__":
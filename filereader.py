@@ -1,12 +1,103 @@
 import sys
 import os
-import json
-import base64
-import vlc
-import re
-from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget, QHBoxLayout, QFileDialog, QMessageBox
+import time
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QWidget, QHBoxLayout, QFileDialog, QMessageBox,
+                             QInputDialog, QDockWidget, QLineEdit, QListWidget, QListWidgetItem, QDialog,
+                             QDialogButtonBox, QPlainTextEdit, QPushButton, QCheckBox)
 from PyQt5.QtWebEngineWidgets import QWebEngineView
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QTimer, QSize
+from PyQt5.QtGui import QFontDatabase, QIcon, QPixmap
+import telemetry
+from audio_engine import DEFAULT_CROSSFADE_SECONDS, SoundtrackEngine
+from audio_store import track_volume
+from bookjson import BOOK_JSON_FILENAME, BOOK_JSON_GZ_FILENAME, iter_book_json
+from book_scheme import BOOK_BASE_URL, BOOK_SCHEME, BookSchemeHandler, register_book_scheme
+from bookpack import PACK_FILENAME, PackedBook
+from catalog import BOOK_FILENAMES, CATALOG_FILENAME, Catalog
+from layout import CALIBRATION_HTML, CALIBRATION_SCRIPT, DEFAULT_PROFILE_PATH, LayoutProfile
+from page_index import ChapterPages, PageIndex
+from render_cache import PageRenderCache, neighbouring_pages
+from search_index import SEARCH_DB_FILENAME, SearchIndex
+from soundtrack_index import SoundtrackIndex
+
+AUDIO_LOOKAHEAD_PAGES = 2
+LOAD_SLICE_SECONDS = 0.02  # Time spent parsing book.json per event loop turn
+SEARCH_DELAY_MS = 150  # Typing pause before the search runs
+STATS_INTERVAL_MS = 500  # How often the open stats panel is refreshed
+WELCOME_HTML = "<html><body><h1>Select a converted ePub to display!</body></html>"
+
+def crossfade_seconds():
+    """
+    Returns the crossfade duration in seconds, configurable through EPUB_READER_CROSSFADE.
+    """
+    value = os.environ.get("EPUB_READER_CROSSFADE")
+    if value is None:
+        return DEFAULT_CROSSFADE_SECONDS
+    try:
+        seconds = float(value)
+    except ValueError:
+        seconds = -1
+    if not 0 <= seconds < float('inf'):
+        print(f"EPUB_READER_CROSSFADE must be a number of seconds, not {value!r}. "
+              f"Using {DEFAULT_CROSSFADE_SECONDS} seconds.")
+        return DEFAULT_CROSSFADE_SECONDS
+    return seconds
+
+
+class LibraryDialog(QDialog):
+    """
+    Lists the books of a library folder's catalog, filtered by title or author as the user types.
+    """
+
+    def __init__(self, library_folder, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Open a Book")
+        self.resize(600, 700)
+        self.catalog = Catalog(library_folder, read_only=True)
+        self.library_folder = library_folder
+
+        self.filter_box = QLineEdit()
+        self.filter_box.setPlaceholderText("Filter by title or author")
+        self.filter_box.textChanged.connect(self.list_books)
+        self.book_list = QListWidget()
+        self.book_list.setIconSize(QSize(48, 64))
+        self.book_list.itemActivated.connect(self.accept)
+        buttons = QDialogButtonBox(QDialogButtonBox.Open | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.filter_box)
+        layout.addWidget(self.book_list)
+        layout.addWidget(buttons)
+        self.list_books()
+
+    def list_books(self):
+        self.book_list.clear()
+        for entry in self.catalog.books(self.filter_box.text()):
+            details = f"{entry.pages} pages"
+            if entry.tracks:
+                details += f", {entry.tracks} soundtracks"
+                if entry.audio_seconds:
+                    details += f" ({entry.audio_seconds / 60:.0f} min)"
+            item = QListWidgetItem(f"{entry.title}\n{entry.author} - {details}")
+            if entry.cover:
+                pixmap = QPixmap()
+                if pixmap.loadFromData(entry.cover):
+                    item.setIcon(QIcon(pixmap))
+            item.setData(Qt.UserRole, entry.folder)
+            self.book_list.addItem(item)
+        if self.book_list.count():
+            self.book_list.setCurrentRow(0)
+
+    def selected_folder(self):
+        item = self.book_list.currentItem()
+        return os.path.join(self.library_folder, item.data(Qt.UserRole)) if item else None
+
+    def done(self, result):
+        self.catalog.close()
+        super().done(result)
+
 
 class EpubReaderApp(QMainWindow):
     def __init__(self):
@@ -14,10 +105,17 @@ class EpubReaderApp(QMainWindow):
         self.epub_folder = None
         self.book_contents = None
         self.book = {}
+        self.page_index = PageIndex()
         self.current_page = 1
         self.soundtracks = {}
-        self.current_soundtrack = None
-        self.player = None  # Initialize the player attribute
+        self.soundtrack_index = SoundtrackIndex()
+        self.audio_tracks = {}  # Loudness measurements of the packaged soundtracks
+        self.audio = SoundtrackEngine(crossfade_seconds())
+        self.render_cache = PageRenderCache(self.render_page)
+        if os.environ.get("EPUB_READER_DEBUG"):
+            telemetry.enable()  # Also shows page-turn stats in the status bar, see telemetry.py
+        self.page_turn_started = None
+        self.search_index = None
         self.initUI()
 
     def initUI(self):
@@ -36,51 +134,164 @@ class EpubReaderApp(QMainWindow):
         # WebEngineView for HTML content with fixed size
         self.web_view = QWebEngineView()
         self.web_view.setFixedSize(816, 1056)
+        self.web_view.loadFinished.connect(self.page_load_finished)
+        # Images are served from the book folder through the book:// scheme
+        self.scheme_handler = BookSchemeHandler(self)
+        # Large images are served as the variant that fits the page
+        self.scheme_handler.viewport_width = self.web_view.width()
+        self.scheme_handler.viewport_height = self.web_view.height()
+        self.scheme_handler.pixel_ratio = self.web_view.devicePixelRatioF()
+        self.web_view.page().profile().installUrlSchemeHandler(BOOK_SCHEME, self.scheme_handler)
         center_layout.addWidget(self.web_view, 0, Qt.AlignCenter)
 
-        # Display an empty page initially
-        self.web_view.setHtml("<html><body><h1>Select a converted ePub to display!</body></html>")
+        # Search panel, opened with Ctrl+F
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Search the book")
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_box.textChanged.connect(lambda: self.search_timer.start(SEARCH_DELAY_MS))
+        self.search_box.returnPressed.connect(self.run_search)
+        self.search_results = QListWidget()
+        self.search_results.itemActivated.connect(self.go_to_search_result)
+        self.search_results.itemClicked.connect(self.go_to_search_result)
+        search_panel = QWidget()
+        search_layout = QVBoxLayout(search_panel)
+        search_layout.addWidget(self.search_box)
+        search_layout.addWidget(self.search_results)
+        self.search_dock = QDockWidget("Search", self)
+        self.search_dock.setWidget(search_panel)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.search_dock)
+        self.search_dock.hide()
+
+        # Live timings and counters, opened with F12 (see telemetry.py)
+        self.stats_text = QPlainTextEdit()
+        self.stats_text.setReadOnly(True)
+        self.stats_text.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.telemetry_checkbox = QCheckBox("Collect timings")
+        self.telemetry_checkbox.setChecked(telemetry.enabled)
+        self.telemetry_checkbox.toggled.connect(lambda checked: telemetry.enable() if checked else telemetry.disable())
+        save_trace_button = QPushButton("Save Trace")
+        save_trace_button.clicked.connect(self.save_trace)
+        stats_panel = QWidget()
+        stats_layout = QVBoxLayout(stats_panel)
+        stats_layout.addWidget(self.telemetry_checkbox)
+        stats_layout.addWidget(save_trace_button)
+        stats_layout.addWidget(self.stats_text)
+        self.stats_dock = QDockWidget("Performance", self)
+        self.stats_dock.setWidget(stats_panel)
+        self.addDockWidget(Qt.LeftDockWidgetArea, self.stats_dock)
+        self.stats_dock.hide()
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self.refresh_stats)
+        # Also stops refreshing when the dock is closed with its own button
+        self.stats_dock.visibilityChanged.connect(self.stats_visibility_changed)
+
+        # Display an empty page initially, once the page is measured for layout-aware conversion
+        # the first time the reader runs
+        if os.path.exists(DEFAULT_PROFILE_PATH):
+            self.web_view.setHtml(WELCOME_HTML)
+        else:
+            self.calibrate_layout()
 
         # Set a timer to prompt the user for the EPUB folder after the main window is shown
         QTimer.singleShot(100, self.prompt_for_epub_folder)
 
     def prompt_for_epub_folder(self):
-        self.epub_folder = QFileDialog.getExistingDirectory(None, "Select EPUB Folder")
+        self.epub_folder = QFileDialog.getExistingDirectory(None, "Select EPUB Folder or Library")
+        # A library folder with a catalog lists its books instead of being opened as a book
+        if (self.epub_folder and os.path.exists(os.path.join(self.epub_folder, CATALOG_FILENAME))
+                and not any(os.path.exists(os.path.join(self.epub_folder, name)) for name in BOOK_FILENAMES)):
+            self.epub_folder = self.choose_library_book(self.epub_folder)
         if not self.epub_folder:
             QMessageBox.critical(self, "Error", "No folder selected. The application will now exit.")
             sys.exit(-1)  # Exit if no folder selected
+        self.scheme_handler.book_folder = self.epub_folder
+        self.scheme_handler.clear_images()
+        self.open_search_index()
 
         # Load and display EPUB content
         self.load_epub_content()
 
+    def choose_library_book(self, library_folder):
+        dialog = LibraryDialog(library_folder, self)
+        if dialog.exec_() != QDialog.Accepted:
+            return None
+        return dialog.selected_folder()
+
     def load_epub_content(self):
         try:
-            self.book_file = os.path.join(self.epub_folder, "book.json")
-            with open(self.book_file, "r") as file:
-                self.book_contents = json.load(file)
-            
-            # Extract soundtracks from book contents
-            self.extract_soundtracks()
-
-            page_num = 0
-            for chapter in self.book_contents["chapters"]:
-                for key, value in chapter["text"].items():
-                    page_num += 1
-                    self.book[page_num] = value
+            pack_file = os.path.join(self.epub_folder, PACK_FILENAME)
+            if os.path.exists(pack_file):
+                # Packed books only load their metadata; pages are read on demand
+                self.book_file = pack_file
+                self.book = PackedBook(pack_file)
+                self.book_contents = self.book.metadata
+                self.page_index = PageIndex.from_chapters(self.book.chapters)
+                for chapter in self.book.chapters:
+                    self.scheme_handler.add_chapter_images(chapter.get("images", {}))
+                self.extract_soundtracks()
+                self.display_current_page()
+                return
+
+            self.book_file = os.path.join(self.epub_folder, BOOK_JSON_GZ_FILENAME)
+            if not os.path.exists(self.book_file):
+                self.book_file = os.path.join(self.epub_folder, BOOK_JSON_FILENAME)
+
+            # Global page numbers map onto the chapters without copying the pages
+            self.book_contents = {"chapters": []}
+            self.book = ChapterPages(self.book_contents["chapters"])
+            self.page_index = self.book.index
+
+            # Chapters are parsed a few at a time from the event loop, and the first page is shown as soon as it is read
+            self.book_loader = iter_book_json(self.book_file)
+            self.load_started = time.perf_counter()
+            self.first_page_shown = False
+            self.load_more_chapters()
+        except Exception as e:
+            self.show_error_message(f"Error loading EPUB file: {str(e)}")
 
-            self.display_current_page()
+    def load_more_chapters(self):
+        try:
+            slice_ends = time.perf_counter() + LOAD_SLICE_SECONDS
+            for key, value in self.book_loader:
+                if key == "chapter":
+                    self.book.append(value)
+                    self.scheme_handler.add_chapter_images(value.get("images", {}))
+                    if not self.first_page_shown and self.current_page in self.book:
+                        self.first_page_shown = True
+                        self.display_current_page()
+                        telemetry.record("first page", time.perf_counter() - self.load_started)
+                else:
+                    self.book_contents[key] = value
+                    if key in ("soundtracks", "audio"):
+                        self.extract_soundtracks()
+                if time.perf_counter() >= slice_ends:
+                    # Let Qt handle input and paint before reading on
+                    QTimer.singleShot(0, self.load_more_chapters)
+                    return
         except Exception as e:
             self.show_error_message(f"Error loading EPUB file: {str(e)}")
+            return
+
+        self.book_loader = None
+        if not self.first_page_shown:
+            self.display_current_page()
+        telemetry.record("load book", time.perf_counter() - self.load_started, pages=len(self.book))
 
     def extract_soundtracks(self):
         if "soundtracks" in self.book_contents:
             self.soundtracks = self.book_contents["soundtracks"]
+            self.soundtrack_index = SoundtrackIndex(self.soundtracks)
+        self.audio_tracks = self.book_contents.get("audio", {})
 
     def display_current_page(self):
         if self.book:
             if 1 <= self.current_page <= len(self.book):
-                current_page_content = self.book[self.current_page]
-                self.display_html_content(current_page_content)
+                self.page_turn_started = time.perf_counter()
+                self.display_html_content(self.render_cache.get(self.current_page))
+                # Render the surrounding pages in the background so the next turn is a cache hit
+                self.render_cache.prefetch(neighbouring_pages(self.current_page, len(self.book)))
                 self.play_or_stop_soundtrack()
                 self.update_window_title()  # Update window title with current page number
             else:
@@ -88,85 +299,64 @@ class EpubReaderApp(QMainWindow):
         else:
             self.show_error_message("EPUB file not loaded.")
 
-    def display_html_content(self, html_content):
+    def render_page(self, page_number):
+        # Runs on the prefetch thread as well as the UI thread, so it must not touch any widgets
+        with telemetry.timer("render", page=page_number):
+            return self.render_page_html(page_number)
+
+    def render_page_html(self, page_number):
+        html_content = self.book[page_number]
+
         # Generate full HTML content with text and images
-        html_page = "<html><head><style>img { max-width: 100%; height: auto; }</style></head><body>"
+        html_page = "<html><head><style>img { max-width: 100%; max-height: calc(100vh - 16px); height: auto; }</style></head><body>"
         
-        # Check if the content is a dictionary (indicating it has text and images)
         if isinstance(html_content, str):
-            processed_html = self.process_html_with_images(html_content)
-            html_page += processed_html
+            # Relative image sources resolve against the book:// base URL
+            html_page += html_content
         else:
             # If the content is not as expected, show an error message
-            self.show_error_message("Invalid content format. Unable to display.")
+            html_page += "<h1>Invalid content format. Unable to display.</h1>"
 
         html_page += "</body></html>"
-        
+        return html_page
+
+    def display_html_content(self, html_page):
         # Display HTML content in QWebEngineView
-        self.web_view.setHtml(html_page)
-
-
-    def process_html_with_images(self, html_content):
-        img_pattern = r'<img\s+[^>]*src="([^"]+)"[^>]*>'  # Regex to extract image src
-        processed_html = html_content
-
-        # Track processed images to avoid duplicates
-        processed_images = set()
-
-        for match in re.finditer(img_pattern, html_content):
-            img_tag = match.group(0)  # Get the entire img tag
-            img_src = match.group(1)  # Get the src attribute value
-            img_path = os.path.abspath(os.path.join(self.epub_folder, img_src.replace("../", "")))
-            print("Checking Existing:", img_path)
-            if os.path.exists(img_path):
-                print("Exists:",img_path)
-                if img_src not in processed_images:
-                    with open(img_path, "rb") as img_file:
-                        print(1)
-                        img_data = base64.b64encode(img_file.read()).decode("utf-8")
-                        print("Open Success:", img_path, "\n")
-                    embedded_img_tag = f'<img src="data:image/jpeg;base64,{img_data}">'
-                    processed_html = processed_html.replace(img_tag, embedded_img_tag, 1)  # Replace only once
-                    processed_images.add(img_src)  # Add to processed images set
-            else:
-                print(f"Image not found: {img_path}")  # Print error if image not found
+        self.web_view.setHtml(html_page, BOOK_BASE_URL)
 
-        return processed_html
+    def page_load_finished(self, ok):
+        if self.page_turn_started is None:
+            return
+        latency = time.perf_counter() - self.page_turn_started
+        self.page_turn_started = None
+        telemetry.record("page turn", latency, page=self.current_page)
+        if telemetry.enabled:
+            cache = self.render_cache
+            self.statusBar().showMessage(f"Page {self.current_page} | page turn {latency * 1000:.1f} ms | "
+                                         f"render cache {cache.hit_rate:.0%} hits ({cache.hits}/{cache.hits + cache.misses})")
 
 
     def play_or_stop_soundtrack(self):
-        if self.soundtracks:
-            for soundtrack_key, mp3_file in self.soundtracks.items():
-                page_range = soundtrack_key.split('-')
-                if len(page_range) == 2:
-                    start_page, end_page = map(int, page_range)
-
-                    if start_page <= self.current_page <= end_page:
-                        if self.current_soundtrack != soundtrack_key:
-                            self.stop_soundtrack()  # Stop any currently playing soundtrack
-                            self.current_soundtrack = soundtrack_key
-                            self.play_soundtrack(mp3_file)
-                        return
-
-            # No matching page range found, stop the soundtrack
-            if self.current_soundtrack is not None:
-                self.stop_soundtrack()
-                self.current_soundtrack = None
-
-    def play_soundtrack(self, soundtrack_path):
-        if not self.player:
-            self.player = vlc.MediaPlayer(soundtrack_path)
-            self.player.play()
-            self.player.audio_set_volume(100)  # Set volume to maximum when starting playback
-
-    def stop_soundtrack(self):
-        if self.player:
-            self.player.stop()
-            self.player.audio_set_volume(100)  # Reset volume to maximum
-            self.player = None
+        # Every track of every cue covering the page plays; overlapping cues are layered.
+        # Packaged tracks are relative to the book folder and play at their normalised loudness
+        active = []
+        volumes = {}
+        for cue in self.soundtrack_index.cues_at(self.current_page):
+            for mp3_file in cue.tracks:
+                soundtrack = (cue.key, os.path.join(self.epub_folder, mp3_file))
+                active.append(soundtrack)
+                volumes[soundtrack] = track_volume(self.audio_tracks.get(mp3_file))
+        self.audio.play_only(active, volumes, requested_at=self.page_turn_started)
+
+        # Open the tracks of cues starting within a few pages so they are ready when the reader gets there
+        upcoming = self.soundtrack_index.cues_between(self.current_page - AUDIO_LOOKAHEAD_PAGES,
+                                                      self.current_page + AUDIO_LOOKAHEAD_PAGES)
+        self.audio.preload([os.path.join(self.epub_folder, mp3_file) for cue in upcoming for mp3_file in cue.tracks
+                            if not self.audio.is_playing((cue.key, os.path.join(self.epub_folder, mp3_file)))])
 
     def update_window_title(self):
-        self.setWindowTitle(f'EPUB Reader (Page: {self.current_page})')
+        chapter, local_page = self.page_index.locate(self.current_page)
+        self.setWindowTitle(f'EPUB Reader (Page: {self.current_page} - Chapter {chapter + 1}, page {local_page})')
 
     def next_page(self):
         if self.book:
@@ -180,11 +370,117 @@ class EpubReaderApp(QMainWindow):
                 self.current_page -= 1
                 self.display_current_page()
 
+    def go_to_page(self):
+        if not self.book:
+            return
+        page_number, ok = QInputDialog.getInt(self, "Go to Page", f"Page (1-{len(self.book)}):",
+                                              self.current_page, 1, len(self.book))
+        if ok and page_number != self.current_page:
+            self.current_page = page_number
+            self.display_current_page()
+
+    def open_search_index(self):
+        search_file = os.path.join(self.epub_folder, SEARCH_DB_FILENAME)
+        if os.path.exists(search_file):
+            self.search_index = SearchIndex(search_file)
+            self.search_box.setEnabled(True)
+            self.search_box.setPlaceholderText("Search the book")
+        else:
+            self.search_index = None
+            self.search_box.setEnabled(False)
+            self.search_box.setPlaceholderText("No search index, convert the book again to search it")
+
+    def show_search(self):
+        self.search_dock.show()
+        self.search_box.setFocus()
+        self.search_box.selectAll()
+
+    def run_search(self):
+        self.search_timer.stop()
+        self.search_results.clear()
+        if self.search_index is None:
+            return
+        started = time.perf_counter()
+        with telemetry.timer("search"):
+            results = self.search_index.search(self.search_box.text())
+        for page_number, snippet in results:
+            item = QListWidgetItem(f"Page {page_number}: {snippet}")
+            item.setData(Qt.UserRole, page_number)
+            self.search_results.addItem(item)
+        self.statusBar().showMessage(f"{len(results)} results in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def go_to_search_result(self, item):
+        page_number = item.data(Qt.UserRole)
+        if page_number not in self.book:
+            self.statusBar().showMessage(f"Page {page_number} is still loading")
+            return
+        self.current_page = page_number
+        self.display_current_page()
+
+    def calibrate_layout(self):
+        """
+        Renders a sample page and saves the measured viewport and font as the layout profile that
+        convert.py --layout and createbook.py fit pages to.
+        """
+        self.web_view.loadFinished.connect(self.measure_layout)
+        self.web_view.setHtml(CALIBRATION_HTML)
+
+    def measure_layout(self, ok):
+        self.web_view.loadFinished.disconnect(self.measure_layout)
+        self.web_view.page().runJavaScript(CALIBRATION_SCRIPT, self.layout_measured)
+
+    def layout_measured(self, metrics):
+        if not metrics:
+            self.statusBar().showMessage("Could not measure the page layout")
+        else:
+            profile = LayoutProfile.from_dict(metrics)
+            profile_path = profile.save()
+            self.statusBar().showMessage(f"Saved layout profile to {profile_path}")
+        if self.book:
+            self.display_current_page()
+        else:
+            self.web_view.setHtml(WELCOME_HTML)
+
+    def toggle_stats(self):
+        self.stats_dock.setVisible(not self.stats_dock.isVisible())
+
+    def stats_visibility_changed(self, visible):
+        if visible:
+            self.refresh_stats()
+            self.stats_timer.start(STATS_INTERVAL_MS)
+        else:
+            self.stats_timer.stop()
+
+    def refresh_stats(self):
+        self.telemetry_checkbox.setChecked(telemetry.enabled)
+        self.stats_text.setPlainText(telemetry.format_stats())
+
+    def save_trace(self):
+        trace_path, _ = QFileDialog.getSaveFileName(self, "Save Trace", "trace.json", "Chrome trace (*.json)")
+        if trace_path:
+            telemetry.dump_trace(trace_path)
+            self.statusBar().showMessage(f"Saved trace to {trace_path}")
+
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_Right:
             self.next_page()
         elif event.key() == Qt.Key_Left:
             self.previous_page()
+        elif event.key() == Qt.Key_G and event.modifiers() & Qt.ControlModifier:
+            self.go_to_page()
+        elif event.key() == Qt.Key_F and event.modifiers() & Qt.ControlModifier:
+            self.show_search()
+        elif event.key() == Qt.Key_L and event.modifiers() & Qt.ControlModifier:
+            self.calibrate_layout()
+        elif event.key() == Qt.Key_F12:
+            self.toggle_stats()
+
+    def closeEvent(self, event):
+        self.render_cache.shutdown()
+        self.audio.shutdown()
+        if self.search_index is not None:
+            self.search_index.close()
+        super().closeEvent(event)
 
     def show_error_message(self, message):
         # Display error message in QWebEngineView
@@ -192,6 +488,7 @@ class EpubReaderApp(QMainWindow):
         self.web_view.setHtml(error_html)
 
 if __name__ == '__main__':
+    register_book_scheme()
     app = QApplication(sys.argv)
     reader = EpubReaderApp()
     reader.show()
@@ -0,0 +1,118 @@
+"""
+Content-addressed export of a book's images.
+
+Every image is stored once under the SHA-256 of its bytes, so same-named images
+in different folders no longer overwrite each other and unchanged images are not
+rewritten on every save. An optional shared library folder deduplicates images
+across books; each book folder then gets hard links into the library.
+"""
+import hashlib
+import html
+import os
+import posixpath
+import re
+import shutil
+from urllib.parse import unquote
+
+import telemetry
+
+IMAGES_FOLDER = 'images'
+
+# Walks the attributes before src one by one so quoted values containing " src=" are skipped.
+_IMG_SRC = re.compile(r'''(<img\b(?:\s+(?!src=)[^\s=/>]+(?:=(?:"[^"]*"|'[^']*'))?)*\s+src=)(["'])(.*?)\2''')
+
+
+def image_filename(name, content):
+    """
+    Returns the content-addressed file name for an image, keeping its extension.
+    """
+    extension = posixpath.splitext(name)[1].lower()
+    return hashlib.sha256(content).hexdigest() + extension
+
+
+def _write_atomically(path, content):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def export_images(book_images, output_folder, library_folder=None):
+    """
+    Stores a book's images in '<output_folder>/images/' under content-addressed names.
+
+    Parameters:
+    - book_images (dict): Manifest image names mapped to their bytes, as returned by parse_epub.
+    - output_folder (str): The book's conversion folder.
+    - library_folder (str): Optional folder shared between books. Images are stored there once
+      and hard linked (or copied, where linking is not possible) into the book's images folder.
+
+    Returns a dict of manifest image names to paths relative to output_folder.
+    """
+    images_folder = os.path.join(output_folder, IMAGES_FOLDER)
+    os.makedirs(images_folder, exist_ok=True)
+    if library_folder:
+        os.makedirs(library_folder, exist_ok=True)
+
+    stored = {}
+    written = 0
+    for name, content in book_images.items():
+        filename = image_filename(name, content)
+        stored[name] = posixpath.join(IMAGES_FOLDER, filename)
+        output_path = os.path.join(images_folder, filename)
+        if os.path.exists(output_path):
+            continue  # Same name means same content
+
+        if library_folder:
+            library_path = os.path.join(library_folder, filename[:2], filename)
+            if not os.path.exists(library_path):
+                os.makedirs(os.path.dirname(library_path), exist_ok=True)
+                _write_atomically(library_path, content)
+            try:
+                os.link(library_path, output_path)
+            except OSError:
+                shutil.copyfile(library_path, output_path)
+        else:
+            _write_atomically(output_path, content)
+        written += 1
+
+    telemetry.count("images stored", len(stored))
+    telemetry.count("images written", written)
+    return stored
+
+
+def resolve_image_source(chapter_name, src):
+    """
+    Resolves an img src found in a chapter to the manifest name of the image it points at.
+    """
+    src = unquote(src.split('#', 1)[0])
+    return posixpath.normpath(posixpath.join(posixpath.dirname(chapter_name), src))
+
+
+def rewrite_chapter_images(chapter, stored):
+    """
+    Points a chapter's images dict and the img tags in its pages at the stored image files.
+
+    `stored` maps manifest names to stored paths, as returned by export_images. Sources that do
+    not resolve to a stored image (external URLs, or ones already rewritten) are left unchanged.
+    """
+    chapter_name = chapter["title"]
+
+    def stored_path(src):
+        return stored.get(resolve_image_source(chapter_name, src), src)
+
+    def replace_src(match):
+        src = html.unescape(match.group(3))
+        new_src = stored_path(src)
+        if new_src == src:
+            return match.group(0)
+        return match.group(1) + match.group(2) + html.escape(new_src, quote=False) + match.group(2)
+
+    # Entries that are already dicts have variants (see image_variants) and point at stored images
+    chapter["images"] = {number: stored_path(src) if isinstance(src, str) else src for number, src in chapter["images"].items()}
+    chapter["text"] = {page_number: _IMG_SRC.sub(replace_src, page) for page_number, page in chapter["text"].items()}
@@ -0,0 +1,145 @@
+"""
+Downscaled variants of a book's images, made when the book is saved.
+
+Scanned illustrations are often several thousand pixels across, while the
+reader shows pages 816 pixels wide. For every stored image larger than a
+variant's bounding box, a "display" copy that fits the reader page and a small
+"thumb" copy are written next to it in the images folder, optionally as WebP.
+The chapter's images dict then records, per image, its size and its variants:
+
+    {"src": "images/<hash>.jpg", "width": 3000, "height": 4000,
+     "variants": {"display": {"src": "images/<hash>.display.jpg", "width": 792, "height": 1056},
+                  "thumb": {...}}}
+
+The page HTML keeps pointing at the original; the reader's book:// handler
+picks the variant that fits its viewport (see pick_variant). Variants are made in a process pool
+with Pillow, which is optional: without it the images are used as they are.
+"""
+import os
+import posixpath
+from concurrent.futures import ProcessPoolExecutor
+
+import telemetry
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Bounding boxes (width, height) of the variants, largest first
+VARIANT_SIZES = {
+    "display": (816, 1056),
+    "thumb": (200, 260),
+}
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+_SAVE_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP'}
+
+
+def image_source(entry):
+    """
+    Returns the stored path of a chapter image entry, which is either a path or a dict with variants.
+    """
+    return entry["src"] if isinstance(entry, dict) else entry
+
+
+def _make_variants(output_folder, stored_path, webp):
+    """
+    Writes the variants of one stored image. Runs in the worker processes.
+
+    Returns the image's entry for chapter["images"], or the stored path itself if it has no variants.
+    """
+    base, extension = posixpath.splitext(stored_path)
+    with Image.open(os.path.join(output_folder, stored_path)) as image:
+        width, height = image.size
+        if getattr(image, "n_frames", 1) > 1:
+            return stored_path  # Animations would lose their frames
+        entry = {"src": stored_path, "width": width, "height": height, "variants": {}}
+        for name, box in VARIANT_SIZES.items():
+            if width <= box[0] and height <= box[1]:
+                continue  # Already fits, the original is used
+            variant_extension = '.webp' if webp else (extension.lower() if extension.lower() in _SAVE_FORMATS else '.png')
+            variant_path = f"{base}.{name}{variant_extension}"
+            variant = image.copy()
+            variant.thumbnail(box)
+            file_path = os.path.join(output_folder, variant_path)
+            if not os.path.exists(file_path):  # Same original means same variant
+                save_format = _SAVE_FORMATS[variant_extension]
+                if save_format == 'JPEG' and variant.mode not in ('RGB', 'L'):
+                    variant = variant.convert('RGB')
+                temp_path = f"{file_path}.{os.getpid()}.tmp"
+                variant.save(temp_path, save_format, quality=WEBP_QUALITY if webp else JPEG_QUALITY)
+                os.replace(temp_path, file_path)
+            entry["variants"][name] = {"src": variant_path, "width": variant.width, "height": variant.height}
+    return entry if entry["variants"] else stored_path
+
+
+def _make_variants_safely(output_folder, stored_path, webp):
+    try:
+        return _make_variants(output_folder, stored_path, webp)
+    except Exception as e:
+        print(f"Could not make variants of {stored_path}: {e}")
+        return stored_path
+
+
+def make_image_variants(stored_paths, output_folder, webp=False, workers=None):
+    """
+    Writes the display and thumbnail variants of a book's stored images.
+
+    Parameters:
+    - stored_paths (iterable of str): Image paths relative to output_folder, as returned by export_images.
+    - output_folder (str): The book's conversion folder.
+    - webp (bool): Write the variants as WebP instead of the original format.
+    - workers (int): Processes used to resize the images (default: CPU count).
+
+    Returns a dict of stored paths to their chapter["images"] entries. Empty if Pillow is not installed.
+    """
+    if Image is None:
+        print("Pillow is not installed; images are stored without display and thumbnail variants.")
+        return {}
+
+    stored_paths = sorted(set(stored_paths))
+    workers = workers or os.cpu_count() or 1
+    if workers < 2 or len(stored_paths) < 2:
+        entries = [_make_variants_safely(output_folder, path, webp) for path in stored_paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            entries = list(executor.map(_make_variants_safely, [output_folder] * len(stored_paths), stored_paths,
+                                        [webp] * len(stored_paths)))
+
+    variants = {path: entry for path, entry in zip(stored_paths, entries) if isinstance(entry, dict)}
+    telemetry.count("images resized", len(variants))
+    return variants
+
+
+def record_chapter_variants(chapter, variants):
+    """
+    Replaces the paths in a chapter's images dict with their entries from make_image_variants.
+    """
+    chapter["images"] = {number: variants.get(image_source(entry), entry) for number, entry in chapter["images"].items()}
+
+
+def pick_variant(entry, viewport_width, viewport_height=None, pixel_ratio=1.0):
+    """
+    Returns the path of the smallest variant that fills the box the image is drawn in.
+
+    Pages fit images into the viewport, so the box is the image scaled down to the viewport's width
+    or height, in device pixels (scaled by pixel_ratio), and never larger than the original. A variant
+    fills it when it reaches the box's width or, for portrait images, its height. If no variant is
+    large enough, as on high-DPI screens, the original is used.
+    """
+    if not isinstance(entry, dict):
+        return entry
+    width, height = entry["width"], entry["height"]
+    scale = viewport_width / width
+    if viewport_height:
+        scale = min(scale, viewport_height / height)
+    needed_width = min(width, width * scale * pixel_ratio)
+    needed_height = min(height, height * scale * pixel_ratio)
+    candidates = sorted(entry["variants"].values(), key=lambda variant: variant["width"])
+    for variant in candidates:
+        # Variants are rounded to whole pixels, so one pixel short still fills the box
+        if variant["width"] >= needed_width - 1 or variant["height"] >= needed_height - 1:
+            return variant["src"]
+    return entry["src"]
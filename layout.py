@@ -0,0 +1,494 @@
+"""
+Layout-aware pagination that fills the reader's page.
+
+Word-count pages (see pagination) vary a lot in rendered height: a page of
+short dialogue lines overflows the reader's fixed-size view, while a page
+ending at an image is often nearly empty. Layout pagination instead estimates
+how tall every block renders, from a LayoutProfile of the reader's viewport
+and font (average character width, line height), the browser's default
+margins and heading sizes, and the images' pixel sizes, and fills each page up
+to the viewport height.
+
+Blocks that do not fit on an empty page are split between words: the open
+elements are closed at the end of one page and reopened at the top of the
+next. Only the outermost blocks of a chapter are paginated, so nested elements
+are no longer repeated, and lists, tables and other block elements are kept.
+
+The profile is measured once by the reader (Ctrl+L, and automatically on its
+first start) and saved to DEFAULT_PROFILE_PATH, where the converters pick it
+up. It is part of the chapter cache key, so converting again for a viewport or
+font that was used before is served from the cache.
+"""
+import html
+import json
+import math
+import os
+import re
+import struct
+
+from image_store import resolve_image_source
+from pagination import ChapterPaginator, _Item
+
+# Bump whenever a change alters the pages produced, so cached chapters are re-paginated.
+LAYOUT_VERSION = 1
+
+DEFAULT_PROFILE_PATH = os.path.join(os.path.expanduser('~'), '.config', 'epubmp3enhancer', 'layout.json')
+
+# Outermost elements paginated as one block (nested ones are part of them)
+LAYOUT_BLOCK_TAGS = frozenset([
+    'p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol', 'dl', 'table', 'blockquote', 'pre',
+    'section', 'article', 'aside', 'header', 'footer', 'nav', 'main', 'figure', 'address', 'center', 'hr',
+])
+
+# Font size and vertical margins (both in em) of block elements, from Chromium's default style sheet
+BLOCK_STYLES = {
+    'p': (1, 1), 'h1': (2, 0.67), 'h2': (1.5, 0.83), 'h3': (1.17, 1), 'h4': (1, 1.33), 'h5': (0.83, 1.67),
+    'h6': (0.67, 2.33), 'ul': (1, 1), 'ol': (1, 1), 'dl': (1, 1), 'blockquote': (1, 1), 'pre': (1, 1),
+    'figure': (1, 1), 'hr': (1, 0.5), 'div': (1, 0), 'li': (1, 0), 'dt': (1, 0), 'dd': (1, 0),
+    'table': (1, 0), 'tr': (1, 0), 'caption': (1, 0), 'figcaption': (1, 0), 'section': (1, 0),
+    'article': (1, 0), 'aside': (1, 0), 'header': (1, 0), 'footer': (1, 0), 'nav': (1, 0), 'main': (1, 0),
+    'address': (1, 0), 'center': (1, 0), 'details': (1, 0), 'summary': (1, 0),
+}
+HEADING_TAGS = frozenset(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+BOLD_WIDTH = 1.08  # Headings are bold and a little wider
+
+# Horizontal space taken from the text by indented elements, in pixels
+INDENTS = {'blockquote': 80, 'figure': 80, 'ul': 40, 'ol': 40, 'dd': 40, 'menu': 40, 'dir': 40}
+
+# Elements whose contents are not rendered
+HIDDEN_TAGS = frozenset(['template', 'head', 'title', 'rt', 'rp', 'noscript'])
+
+# A heading at the bottom of a page needs this many lines of body text below it, or it moves on
+HEADING_KEEP_LINES = 2
+
+# Page the reader renders to measure its profile, with the same style sheet as its book pages
+CALIBRATION_SAMPLE = (
+    "The old ferry left the harbour at seven, and by the time the fog lifted the town was only a grey line "
+    "behind them. Nobody on deck said much; the children watched the gulls, their parents counted the bags, "
+    "and the captain, who had made the crossing a thousand times, read yesterday's paper by the wheel."
+)
+CALIBRATION_LINES = 20
+CALIBRATION_HTML = (
+    "<html><head><style>img { max-width: 100%; max-height: calc(100vh - 16px); height: auto; }</style></head><body>"
+    f"<p><span id='sample' style='white-space: nowrap'>{CALIBRATION_SAMPLE}</span></p>"
+    f"<div id='lines'>{'x<br>' * CALIBRATION_LINES}</div></body></html>"
+)
+# Returns the profile fields as measured in the rendered calibration page
+CALIBRATION_SCRIPT = """
+(function() {
+    var sample = document.getElementById('sample'), lines = document.getElementById('lines');
+    if (!sample || !lines) { return null; }
+    var style = getComputedStyle(document.body), fontSize = parseFloat(style.fontSize);
+    return {
+        viewport_width: document.documentElement.clientWidth, viewport_height: document.documentElement.clientHeight,
+        body_margin: parseFloat(style.marginLeft), font_family: style.fontFamily, font_size: fontSize,
+        char_width: sample.getBoundingClientRect().width / sample.textContent.length / fontSize,
+        line_height: lines.getBoundingClientRect().height / %d / fontSize
+    };
+})()
+""" % CALIBRATION_LINES
+
+_TOKEN = re.compile(r'<!--.*?-->|<!\[CDATA\[.*?\]\]>|<(script|style)\b[^>]*>.*?</\1\s*>|<[^>]*>|[^<]+', re.S | re.I)
+_TAG_NAME = re.compile(r'<(/?)([^\s/>]+)')
+_WHITESPACE_SPLIT = re.compile(r'([ \t\n\r\f]+)')
+_ATTRIBUTE = r'''\s%s=(?:"([^"]*)"|'([^']*)')'''
+
+
+class LayoutProfile:
+    """
+    The reader's viewport and font metrics, in CSS pixels.
+
+    - char_width: average advance of a character of running text, in em.
+    - line_height: distance between baselines, in em.
+    - fill_ratio: share of the page height filled, leaving room for estimation errors.
+    """
+
+    FIELDS = ('viewport_width', 'viewport_height', 'body_margin', 'font_family', 'font_size', 'line_height',
+              'char_width', 'fill_ratio')
+
+    def __init__(self, viewport_width=816, viewport_height=1056, body_margin=8, font_family='serif', font_size=16,
+                 line_height=1.15, char_width=0.45, fill_ratio=0.95):
+        self.viewport_width = viewport_width
+        self.viewport_height = viewport_height
+        self.body_margin = body_margin
+        self.font_family = font_family
+        self.font_size = font_size
+        self.line_height = line_height
+        self.char_width = char_width
+        self.fill_ratio = fill_ratio
+
+    @property
+    def content_width(self):
+        return self.viewport_width - 2 * self.body_margin
+
+    @property
+    def page_height(self):
+        return (self.viewport_height - 2 * self.body_margin) * self.fill_ratio
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**{field: values[field] for field in cls.FIELDS if field in values})
+
+    def save(self, path=DEFAULT_PROFILE_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=4)
+        return path
+
+    @classmethod
+    def load(cls, path=DEFAULT_PROFILE_PATH):
+        """
+        Reads a saved profile, or returns the default profile if there is none at path.
+        """
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+    def __eq__(self, other):
+        return isinstance(other, LayoutProfile) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"LayoutProfile({self.to_dict()})"
+
+
+def image_dimensions(content):
+    """
+    Returns the (width, height) in pixels of PNG, GIF, JPEG or WebP image bytes, or None for
+    other formats, read from the file header.
+    """
+    try:
+        if content[:8] == b'\x89PNG\r\n\x1a\n':
+            return struct.unpack('>II', content[16:24])
+        if content[:6] in (b'GIF87a', b'GIF89a'):
+            return struct.unpack('<HH', content[6:10])
+        if content[:4] == b'RIFF' and content[8:12] == b'WEBP':
+            chunk = content[12:16]
+            if chunk == b'VP8 ':
+                width, height = struct.unpack('<HH', content[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            if chunk == b'VP8L':
+                bits = int.from_bytes(content[21:25], 'little')
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b'VP8X':
+                return int.from_bytes(content[24:27], 'little') + 1, int.from_bytes(content[27:30], 'little') + 1
+            return None
+        if content[:2] == b'\xff\xd8':
+            position = 2
+            while position + 9 < len(content):
+                if content[position] != 0xFF:
+                    return None
+                marker = content[position + 1]
+                if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                    position += 2
+                    continue
+                length = struct.unpack('>H', content[position + 2:position + 4])[0]
+                # Start-of-frame markers hold the size; C4, C8 and CC are other tables
+                if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                    height, width = struct.unpack('>HH', content[position + 5:position + 9])
+                    return width, height
+                position += 2 + length
+    except struct.error:
+        pass
+    return None
+
+
+def book_image_sizes(book_images):
+    """
+    Returns a dict of image item names to their (width, height), for the images whose size can be read.
+    """
+    sizes = {}
+    for name, content in book_images.items():
+        size = image_dimensions(content)
+        if size is not None:
+            sizes[name] = tuple(size)
+    return sizes
+
+
+def _attribute(markup, name):
+    match = re.search(_ATTRIBUTE % name, markup)
+    if match is None:
+        return None
+    return html.unescape(match.group(1) if match.group(1) is not None else match.group(2))
+
+
+def _pixels(value):
+    try:
+        return float(value.strip().removesuffix('px')) if value else None
+    except ValueError:
+        return None
+
+
+class PageLayout:
+    """
+    Lays out the outermost blocks of a chapter one after another, starting a new page
+    whenever the next line or image would not fit. `pages` maps page numbers to HTML.
+    """
+
+    def __init__(self, profile, image_size=None):
+        """
+        Parameters:
+        - profile (LayoutProfile): The reader's viewport and font.
+        - image_size (callable): Takes an img src and returns its (width, height) in pixels, or None.
+        """
+        self.profile = profile
+        self._image_size = image_size or (lambda src: None)
+        self.pages = {}
+        self._page = 1
+        self._parts = []
+        self._height = 0.0  # Estimated height of the current page so far
+        self._margin = 0.0  # Collapsed vertical margin waiting for the next content
+        self._line_width = None  # Width used on the open line, None if no line is open
+        self._space = False  # Whitespace seen since the last word
+        self._page_has_content = False
+        # Elements open within the current block, as (tag, start markup, font scale, indent)
+        self._stack = []
+        self._hidden = 0
+        self._item_start = 0
+        self._item_start_height = 0.0
+        self._item_has_content = False
+
+    # Measurements
+
+    def _scale(self):
+        return self._stack[-1][2] if self._stack else 1.0
+
+    def _indent(self):
+        return self._stack[-1][3] if self._stack else 0
+
+    def _line_height(self):
+        return self.profile.font_size * self._scale() * self.profile.line_height
+
+    def _word_width(self, word):
+        width = len(html.unescape(word)) * self.profile.char_width * self.profile.font_size * self._scale()
+        if any(tag in HEADING_TAGS for tag, _, _, _ in self._stack):
+            width *= BOLD_WIDTH
+        return width
+
+    def _image_height(self, markup):
+        available_width = self.profile.content_width - self._indent()
+        width = _pixels(_attribute(markup, 'width'))
+        height = _pixels(_attribute(markup, 'height'))
+        if not (width and height):
+            size = self._image_size(_attribute(markup, 'src'))
+            if size is None or not size[0]:
+                return self.profile.page_height / 2  # Unknown size, assume half a page
+            width, height = size
+        displayed_height = height * min(1.0, available_width / width)
+        return min(displayed_height, self.profile.page_height)
+
+    # Page building
+
+    def _add_content(self, height):
+        """Makes room for a line or image of the given height, starting a new page if it does not fit."""
+        if self._page_has_content and self._height + self._margin + height > self.profile.page_height:
+            self._break_page()
+        self._height += self._margin + height
+        self._margin = 0.0
+        self._page_has_content = True
+        self._item_has_content = True
+
+    def _break_page(self):
+        if not self._item_has_content:
+            # Nothing of the current block is on this page yet, so it moves to the next page whole
+            carried = self._parts[self._item_start:]
+            del self._parts[self._item_start:]
+            self._finish_page()
+            self._parts = carried
+            self._margin = max([BLOCK_STYLES.get(tag, (1, 0))[1] * self.profile.font_size * scale
+                                for tag, _, scale, _ in self._stack] or [0])
+        else:
+            # Split the block: close its open elements here and reopen them on the next page
+            self._parts.extend(f'</{tag}>' for tag, _, _, _ in reversed(self._stack))
+            self._finish_page()
+            self._parts = [markup for _, markup, _, _ in self._stack]
+            self._margin = 0.0
+            self._line_width = None
+        self._item_start = 0
+        self._item_start_height = 0.0
+
+    def _finish_page(self):
+        if self._parts:
+            self.pages[self._page] = ''.join(self._parts)
+            self._page += 1
+        self._parts = []
+        self._height = 0.0
+        self._page_has_content = False
+
+    def _open(self, tag, markup):
+        font_scale, margin = BLOCK_STYLES.get(tag, (None, 0))
+        scale = self._scale() * (font_scale or 1)
+        if font_scale is not None:
+            self._line_width = None
+            self._margin = max(self._margin, margin * self.profile.font_size * scale)
+        self._stack.append((tag, markup, scale, self._indent() + INDENTS.get(tag, 0)))
+        if tag in HIDDEN_TAGS:
+            self._hidden += 1
+
+    def _close(self, tag):
+        for index in range(len(self._stack) - 1, -1, -1):
+            if self._stack[index][0] == tag:
+                break
+        else:
+            return
+        while len(self._stack) > index:
+            closed, _, scale, _ = self._stack.pop()
+            if closed in HIDDEN_TAGS:
+                self._hidden -= 1
+            if closed in BLOCK_STYLES:
+                self._line_width = None
+                self._margin = max(self._margin, BLOCK_STYLES[closed][1] * self.profile.font_size * scale)
+
+    def _add_text(self, text):
+        preformatted = any(tag == 'pre' for tag, _, _, _ in self._stack)
+        for piece in _WHITESPACE_SPLIT.split(text):
+            if not piece:
+                continue
+            if piece[0] in ' \t\n\r\f':
+                self._parts.append(piece)
+                if preformatted and '\n' in piece:
+                    if self._line_width is None:
+                        self._add_content(self._line_height())
+                    for _ in range(piece.count('\n') - 1):
+                        self._add_content(self._line_height())
+                    self._line_width = None
+                self._space = True
+                continue
+
+            width = self._word_width(piece)
+            available_width = self.profile.content_width - self._indent()
+            space_width = 0.25 * self.profile.font_size * self._scale() if self._space else 0.0
+            self._space = False
+            if self._line_width is not None and self._line_width + space_width + width <= available_width:
+                self._line_width += space_width + width
+                self._parts.append(piece)
+                continue
+            # Starts a new line, or several for a word wider than the page
+            for _ in range(max(1, math.ceil(width / available_width))):
+                self._add_content(self._line_height())
+            self._line_width = width % available_width or available_width
+            self._parts.append(piece)
+
+    def add_block(self, block_html, outer_tag):
+        """
+        Adds the markup of an outermost block (or image) to the pages.
+        """
+        self._item_start = len(self._parts)
+        self._item_start_height = self._height
+        self._item_has_content = False
+        started_on_page = self._page
+        for match in _TOKEN.finditer(block_html):
+            token = match.group(0)
+            if token[0] != '<':
+                if self._hidden:
+                    self._parts.append(token)
+                else:
+                    self._add_text(token)
+                continue
+
+            tag_match = _TAG_NAME.match(token)
+            if tag_match is None or token.startswith('<!') or token.startswith('<?') or match.group(1):
+                self._parts.append(token)  # Comments, doctypes, scripts and styles take no space
+                continue
+            closing, tag = tag_match.group(1), tag_match.group(2).lower()
+            if closing:
+                self._parts.append(token)
+                self._close(tag)
+            elif token.endswith('/>'):
+                self._add_void(tag, token)
+            else:
+                self._parts.append(token)
+                self._open(tag, token)
+
+        # Keep a heading together with the start of the text that follows it
+        if (outer_tag in HEADING_TAGS and self._page == started_on_page and self._item_start > 0
+                and self.profile.page_height - self._height < HEADING_KEEP_LINES * self.profile.font_size * self.profile.line_height):
+            carried = self._parts[self._item_start:]
+            carried_height = self._height - self._item_start_height
+            del self._parts[self._item_start:]
+            self._finish_page()
+            self._parts = carried
+            self._height = carried_height
+            self._page_has_content = True
+
+    def _add_void(self, tag, markup):
+        if self._hidden:
+            self._parts.append(markup)
+            return
+        if tag == 'img':
+            self._line_width = None
+            self._add_content(self._image_height(markup))
+            self._line_width = None
+        elif tag == 'br':
+            if self._line_width is None:
+                self._add_content(self._line_height())
+            self._line_width = None
+        elif tag == 'hr':
+            self._line_width = None
+            self._margin = max(self._margin, 0.5 * self.profile.font_size * self._scale())
+            self._add_content(2)
+            self._margin = 0.5 * self.profile.font_size * self._scale()
+        self._parts.append(markup)
+
+    def finish(self):
+        self._finish_page()
+        return self.pages
+
+
+class _Block(_Item):
+    """An outermost block element, remembering its tag for the layout."""
+
+    __slots__ = ('tag',)
+
+    def __init__(self, tag):
+        super().__init__()
+        self.tag = tag
+
+
+class LayoutPaginator(ChapterPaginator):
+    """
+    ChapterPaginator that lays out the outermost blocks with a PageLayout instead of counting words.
+    """
+
+    def __init__(self, profile, image_size=None):
+        super().__init__()
+        self._layout = PageLayout(profile, image_size)
+        self.pages = self._layout.pages
+
+    def _new_item(self, tag, attributes):
+        if self._open_items:
+            return None  # Laid out as part of the outermost block
+        if tag in LAYOUT_BLOCK_TAGS:
+            return _Block(tag)
+        return super()._new_item(tag, attributes)
+
+    def _add_to_page(self, item):
+        if item.is_image and not item.src:
+            return
+        self._layout.add_block(''.join(item.html), 'img' if item.is_image else item.tag)
+
+    def close(self):
+        super().close()
+        self._layout.finish()
+
+
+def paginate_chapter_layout(html_text, profile, image_sizes=None, chapter_name=''):
+    """
+    Paginates one chapter's body HTML to fill pages of the given LayoutProfile.
+
+    `image_sizes` maps manifest image names to their (width, height); img sources are
+    resolved against `chapter_name`. Returns the same (pages, image sources) tuple as
+    pagination.paginate_chapter.
+    """
+    image_sizes = image_sizes or {}
+
+    def image_size(src):
+        return image_sizes.get(resolve_image_source(chapter_name, src)) if src else None
+
+    paginator = LayoutPaginator(profile, image_size)
+    paginator.feed(html_text)
+    paginator.close()
+    return paginator.pages, paginator.images
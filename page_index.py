@@ -0,0 +1,116 @@
+"""
+Global page numbering for a book's chapters.
+
+Pages are numbered from 1 across the whole book, chapter after chapter, each
+chapter's pages in order of their page number. PageIndex keeps the cumulative
+page count before every chapter, so converting between a global page number
+and a (chapter, page within chapter) pair does not loop over the chapters.
+"""
+from bisect import bisect_right
+
+
+def chapter_page_count(chapter):
+    """
+    Returns the number of pages in a chapter, either a book.json chapter or a book.pack metadata chapter.
+    """
+    if "text" in chapter:
+        return len(chapter["text"])
+    return chapter["pages"]
+
+
+class PageIndex:
+    def __init__(self, page_counts=()):
+        """
+        Parameters:
+        - page_counts (iterable of int): Number of pages in each chapter, in reading order.
+        """
+        self._offsets = [0]  # Pages before each chapter, plus the total at the end
+        for count in page_counts:
+            self._offsets.append(self._offsets[-1] + count)
+
+    def append(self, page_count):
+        """
+        Adds a chapter with page_count pages after the last one.
+        """
+        self._offsets.append(self._offsets[-1] + page_count)
+
+    @classmethod
+    def from_chapters(cls, chapters):
+        return cls(chapter_page_count(chapter) for chapter in chapters)
+
+    @property
+    def chapter_count(self):
+        return len(self._offsets) - 1
+
+    @property
+    def page_count(self):
+        return self._offsets[-1]
+
+    def __len__(self):
+        return self.page_count
+
+    def chapter_pages(self, chapter):
+        """
+        Returns the number of pages in a chapter (0-based chapter index).
+        """
+        return self._offsets[chapter + 1] - self._offsets[chapter]
+
+    def chapter_start(self, chapter):
+        """
+        Returns the global page number of the first page of a chapter (0-based chapter index).
+        """
+        return self._offsets[chapter] + 1
+
+    def to_global(self, chapter, local_page):
+        """
+        Returns the global page number of page `local_page` (1-based) of a chapter (0-based index).
+        """
+        return self._offsets[chapter] + local_page
+
+    def locate(self, page_number):
+        """
+        Returns the (chapter index, page within chapter) of a global page number, both as
+        used by to_global. Raises IndexError if the book has no such page.
+        """
+        if not 1 <= page_number <= self.page_count:
+            raise IndexError(f"Page {page_number} is outside 1-{self.page_count}")
+        # Empty chapters share their offset with the next chapter, and bisect_right skips past them
+        chapter = bisect_right(self._offsets, page_number - 1, 0, self.chapter_count) - 1
+        return chapter, page_number - self._offsets[chapter]
+
+
+class ChapterPages:
+    """
+    Global page view over a book's chapters, numbered by a PageIndex.
+
+    Behaves like the reader's flat page dict without copying the pages into one:
+    len() is the number of pages and pages[n] returns the HTML of global page n.
+    """
+
+    def __init__(self, chapters):
+        self.chapters = chapters
+        self.index = PageIndex.from_chapters(chapters)
+
+    def append(self, chapter):
+        """
+        Adds a chapter after the last one, e.g. while the book is still being read.
+        """
+        self.chapters.append(chapter)
+        self.index.append(chapter_page_count(chapter))
+
+    def __len__(self):
+        return self.index.page_count
+
+    def __contains__(self, page_number):
+        return isinstance(page_number, int) and 1 <= page_number <= self.index.page_count
+
+    def __getitem__(self, page_number):
+        if page_number not in self:
+            raise KeyError(page_number)
+        chapter, local_page = self.index.locate(page_number)
+        pages = self.chapters[chapter]["text"]
+        # book.json keys are strings once loaded back; freshly paginated chapters use ints
+        return pages[local_page] if local_page in pages else pages[str(local_page)]
+
+    def get(self, page_number, default=None):
+        return self[page_number] if page_number in self else default
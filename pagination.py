@@ -0,0 +1,342 @@
+"""
+Single-pass pagination of chapter HTML.
+
+ChapterPaginator listens to html.parser events and splits a chapter into pages
+as the markup streams past, without building a tree. It reproduces what the
+BeautifulSoup based paginator produced (the same elements, serialised the same
+way, and the same 555-word page boundaries) while parsing the chapter once and
+serialising every node once per enclosing paginated element.
+"""
+import re
+from html.entities import html5
+from html.parser import HTMLParser
+
+WORDS_PER_PAGE = 555
+
+# Bump whenever a change alters the pages produced, so cached chapters are re-paginated.
+PAGINATION_VERSION = 1
+
+PAGINATED_TAGS = frozenset(['p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+
+# Elements that never have contents and are written as <tag/>.
+VOID_TAGS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link',
+    'menuitem', 'meta', 'param', 'source', 'track', 'wbr',
+    'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex', 'nextid', 'spacer',
+])
+
+# Whitespace-only text inside these elements is kept as it is.
+PRESERVE_WHITESPACE_TAGS = frozenset(['pre', 'textarea'])
+
+# Text inside these elements is written out unescaped.
+RAW_TEXT_TAGS = frozenset(['script', 'style'])
+
+# Text inside these elements is not counted as page text.
+NON_TEXT_CONTAINER_TAGS = frozenset(['rt', 'rp', 'style', 'script', 'template'])
+
+# Attributes holding whitespace separated lists, normalised to single spaces.
+LIST_ATTRIBUTES = {
+    '*': frozenset(['class', 'accesskey', 'dropzone']),
+    'a': frozenset(['rel', 'rev']),
+    'link': frozenset(['rel', 'rev']),
+    'td': frozenset(['headers']),
+    'th': frozenset(['headers']),
+    'form': frozenset(['accept-charset']),
+    'object': frozenset(['archive']),
+    'area': frozenset(['rel']),
+    'icon': frozenset(['sizes']),
+    'iframe': frozenset(['sandbox']),
+    'output': frozenset(['for']),
+}
+
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+TEXT, CDATA, COMMENT, DOCTYPE, DECLARATION, PROCESSING_INSTRUCTION = range(6)
+
+_WRAPPERS = {
+    CDATA: ('<![CDATA[', ']]>'),
+    COMMENT: ('<!--', '-->'),
+    DOCTYPE: ('<!DOCTYPE ', '>\n'),
+    DECLARATION: ('<?', '?>'),
+    PROCESSING_INSTRUCTION: ('<?', '>'),
+}
+
+_NON_WHITESPACE = re.compile(r'\S+')
+_DECIMAL_REFERENCE = re.compile('^([0-9]+)(.*)')
+_HEX_REFERENCE = re.compile('^([0-9a-f]+)(.*)')
+
+
+def escape_text(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def quote_attribute(value):
+    value = escape_text(value)
+    if '"' in value:
+        if "'" in value:
+            return '"%s"' % value.replace('"', '&quot;')
+        return "'%s'" % value
+    return '"%s"' % value
+
+
+def numeric_character(number):
+    if number == 0 or number > 0x10FFFF or 0xD800 <= number <= 0xDFFF:
+        return '\ufffd'
+    if 0x80 <= number <= 0x9F:
+        try:
+            return bytes([number]).decode('cp1252')
+        except UnicodeDecodeError:
+            pass
+    return chr(number)
+
+
+class _Item:
+    """A paginated element (or image) waiting for its closing tag."""
+
+    __slots__ = ('is_image', 'src', 'html', 'text', 'done')
+
+    def __init__(self, is_image=False, src=None):
+        self.is_image = is_image
+        self.src = src
+        self.html = []
+        self.text = []
+        self.done = False
+
+
+class ChapterPaginator(HTMLParser):
+    """
+    Splits chapter HTML into pages of at most `words_per_page` words.
+
+    Every p, div and h1-h6 element (including nested ones) is added to the
+    current page in document order, starting a new page when it would push
+    the word count over the limit. An img with a src is added and then always
+    ends the page.
+
+    Feed markup with feed() and call close(); the results are in `pages`
+    (page number -> HTML) and `images` (src of every img in the chapter).
+    """
+
+    def __init__(self, words_per_page=WORDS_PER_PAGE):
+        super().__init__(convert_charrefs=False)
+        self.words_per_page = words_per_page
+        self.pages = {}
+        self.images = []
+
+        self._current_page = 1
+        self._current_content = []
+        self._current_word_count = 0
+
+        # Open elements as [name, item] pairs; item is None for elements that are not paginated.
+        self._stack = []
+        self._open_items = []
+        self._queue = []
+        self._queue_start = 0
+        self._preserve_depth = 0
+        self._container_depth = 0
+        self._data = []
+        self._already_closed_void = []
+
+    # Output routing
+
+    def _emit(self, markup):
+        for item in self._open_items:
+            item.html.append(markup)
+
+    def _end_data(self, kind=TEXT):
+        if not self._data:
+            return
+        data = ''.join(self._data)
+        self._data = []
+        if not self._preserve_depth and not data.strip(ASCII_SPACES):
+            data = '\n' if '\n' in data else ' '
+        if not self._open_items:
+            return
+
+        if kind == TEXT:
+            parent = self._stack[-1][0] if self._stack else None
+            self._emit(data if parent in RAW_TEXT_TAGS else escape_text(data))
+            counted = not self._container_depth
+        else:
+            prefix, suffix = _WRAPPERS[kind]
+            self._emit(prefix + data + suffix)
+            counted = kind == CDATA
+
+        if counted:
+            for item in self._open_items:
+                item.text.append(data)
+
+    # Tree construction
+
+    def _push(self, tag, attrs):
+        self._end_data()
+
+        attributes = {}
+        for key, value in attrs:
+            attributes[key] = '' if value is None else value
+        list_attributes = LIST_ATTRIBUTES['*'] | LIST_ATTRIBUTES.get(tag, frozenset())
+        rendered = []
+        for key in sorted(attributes):
+            value = attributes[key]
+            if key in list_attributes:
+                value = ' '.join(_NON_WHITESPACE.findall(value))
+            rendered.append('%s=%s' % (key, quote_attribute(value)))
+        attribute_string = ' ' + ' '.join(rendered) if rendered else ''
+        markup = '<%s%s%s>' % (tag, attribute_string, '/' if tag in VOID_TAGS else '')
+
+        item = self._new_item(tag, attributes)
+        if tag == 'img' and 'src' in attributes:
+            self.images.append(attributes['src'])
+        if item is not None:
+            self._queue.append(item)
+            self._open_items.append(item)
+
+        self._emit(markup)
+        self._stack.append([tag, item])
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth += 1
+        if tag in NON_TEXT_CONTAINER_TAGS:
+            self._container_depth += 1
+
+    def _pop(self):
+        tag, item = self._stack.pop()
+        if tag not in VOID_TAGS:
+            self._emit('</%s>' % tag)
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth -= 1
+        if tag in NON_TEXT_CONTAINER_TAGS:
+            self._container_depth -= 1
+        if item is not None:
+            self._open_items.pop()
+            item.done = True
+            self._flush_queue()
+
+    def _pop_to(self, tag):
+        self._end_data()
+        for index in range(len(self._stack) - 1, -1, -1):
+            if self._stack[index][0] == tag:
+                while len(self._stack) > index:
+                    self._pop()
+                return
+
+    # Pagination
+
+    def _new_item(self, tag, attributes):
+        """Returns the item a newly opened element is paginated as, or None."""
+        if tag in PAGINATED_TAGS:
+            return _Item()
+        if tag == 'img':
+            return _Item(is_image=True, src=attributes.get('src'))
+        return None
+
+    def _flush_queue(self):
+        queue = self._queue
+        while self._queue_start < len(queue) and queue[self._queue_start].done:
+            item = queue[self._queue_start]
+            queue[self._queue_start] = None
+            self._queue_start += 1
+            self._add_to_page(item)
+        if self._queue_start == len(queue):
+            self._queue = []
+            self._queue_start = 0
+
+    def _add_to_page(self, item):
+        if item.is_image:
+            if item.src:
+                self._current_content.append(''.join(item.html))
+                self.pages[self._current_page] = ''.join(self._current_content)
+                self._current_content = []
+                self._current_word_count = 0
+                self._current_page += 1
+            return
+
+        word_count = len(''.join(item.text).split())
+        if self._current_word_count + word_count > self.words_per_page:
+            self.pages[self._current_page] = ''.join(self._current_content)
+            self._current_page += 1
+            self._current_content = []
+            self._current_word_count = 0
+        self._current_content.append(''.join(item.html))
+        self._current_word_count += word_count
+
+    # html.parser events
+
+    def handle_starttag(self, tag, attrs):
+        self._push(tag, attrs)
+        if tag in VOID_TAGS:
+            self._pop_to(tag)
+            self._already_closed_void.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._push(tag, attrs)
+        self._pop_to(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self._already_closed_void:
+            self._already_closed_void.remove(tag)
+        else:
+            self._pop_to(tag)
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def handle_charref(self, name):
+        base, pattern = 10, _DECIMAL_REFERENCE
+        if name[:1] in ('x', 'X'):
+            name = name[1:]
+            base, pattern = 16, _HEX_REFERENCE
+        try:
+            self._data.append(numeric_character(int(name, base)))
+        except ValueError:
+            match = pattern.search(name)
+            if match is None:
+                self._data.append(name)
+            else:
+                self._data.append(numeric_character(int(match.group(1), base)))
+                self._data.append(match.group(2))
+
+    def handle_entityref(self, name):
+        character = html5.get(name + ';', html5.get(name))
+        self._data.append(character if character is not None else '&%s' % name)
+
+    def _handle_special(self, data, kind):
+        self._end_data()
+        self._data.append(data)
+        self._end_data(kind)
+
+    def handle_comment(self, data):
+        self._handle_special(data, COMMENT)
+
+    def handle_decl(self, decl):
+        self._handle_special(decl[len('DOCTYPE '):], DOCTYPE)
+        # The serialised doctype ends with a newline that was parsed back as text.
+        self._data.append('\n')
+
+    def unknown_decl(self, data):
+        if data.upper().startswith('CDATA['):
+            self._handle_special(data[len('CDATA['):], CDATA)
+        else:
+            self._handle_special(data, DECLARATION)
+
+    def handle_pi(self, data):
+        self._handle_special(data, PROCESSING_INSTRUCTION)
+
+    def close(self):
+        super().close()
+        self._end_data()
+        while self._stack:
+            self._pop()
+        if self._current_content:
+            self.pages[self._current_page] = ''.join(self._current_content)
+
+
+def paginate_chapter(html, words_per_page=WORDS_PER_PAGE):
+    """
+    Paginates one chapter's body HTML in a single pass.
+
+    Returns a tuple of the pages dict (page number -> HTML) and the list of
+    image sources found in the chapter.
+    """
+    paginator = ChapterPaginator(words_per_page)
+    paginator.feed(html)
+    paginator.close()
+    return paginator.pages, paginator.images
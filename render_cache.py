@@ -0,0 +1,102 @@
+"""
+Bounded cache of fully rendered reader pages with background prefetching.
+
+The reader renders a page (image processing included) through the cache, and
+asks it to prefetch the neighbouring pages on a worker thread, so turning to
+an adjacent page is usually a dictionary lookup.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CAPACITY = 32
+DEFAULT_PREFETCH = 3
+
+
+class PageRenderCache:
+    def __init__(self, render, capacity=DEFAULT_CAPACITY):
+        """
+        Parameters:
+        - render (callable): Takes a page number and returns the rendered page. Called from
+          the prefetch thread as well, so it must not touch any widgets.
+        - capacity (int): Maximum number of rendered pages kept, least recently used first out.
+        """
+        self._render = render
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._pages = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='page-prefetch')
+
+    def _store(self, page_number, rendered):
+        with self._lock:
+            self._pages[page_number] = rendered
+            self._pages.move_to_end(page_number)
+            while len(self._pages) > self.capacity:
+                self._pages.popitem(last=False)
+
+    def get(self, page_number):
+        """
+        Returns the rendered page, rendering it now if it is neither cached nor being prefetched.
+        """
+        with self._lock:
+            if page_number in self._pages:
+                self._pages.move_to_end(page_number)
+                self.hits += 1
+                return self._pages[page_number]
+            future = self._pending.get(page_number)
+            if future is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if future is not None:
+            return future.result()
+        rendered = self._render(page_number)
+        self._store(page_number, rendered)
+        return rendered
+
+    def _prefetch_page(self, page_number):
+        try:
+            rendered = self._render(page_number)
+            self._store(page_number, rendered)
+            return rendered
+        finally:
+            with self._lock:
+                self._pending.pop(page_number, None)
+
+    def prefetch(self, page_numbers):
+        """
+        Renders the given pages in the background, in order, skipping ones already cached or queued.
+        """
+        with self._lock:
+            for page_number in page_numbers:
+                if page_number in self._pages or page_number in self._pending:
+                    continue
+                self._pending[page_number] = self._executor.submit(self._prefetch_page, page_number)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def neighbouring_pages(page_number, page_count, distance=DEFAULT_PREFETCH):
+    """
+    Returns the pages within `distance` of page_number, nearest first and forwards before backwards.
+    """
+    pages = []
+    for step in range(1, distance + 1):
+        for candidate in (page_number + step, page_number - step):
+            if 1 <= candidate <= page_count:
+                pages.append(candidate)
+    return pages
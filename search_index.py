@@ -0,0 +1,115 @@
+"""
+Full-text search index of a converted book (search.db).
+
+The plain text of every page is stored in a SQLite FTS5 table whose rowid is
+the global page number, written next to book.json (or book.pack) when the book
+is saved. Searching is then an index lookup that returns page numbers and
+highlighted snippets, however many pages the book has, without parsing any
+page HTML at query time.
+"""
+import html
+import os
+import re
+import sqlite3
+from pathlib import Path
+
+SEARCH_DB_FILENAME = 'search.db'
+SEARCH_INDEX_VERSION = 1
+DEFAULT_RESULT_LIMIT = 200
+
+# Pages are serialised by the paginator, so '<' and '>' only appear as markup; the hidden
+# elements and comments go first, with their content, and every other tag becomes a word break
+_HIDDEN = re.compile(r'<!--.*?-->|<(script|style|template|title)\b.*?</\1\s*>', re.S | re.I)
+_TAG = re.compile(r'<[^>]*>')
+
+
+def page_text(page_html):
+    """
+    Returns the visible text of a page's HTML, with runs of whitespace collapsed to single spaces.
+    """
+    text = html.unescape(_TAG.sub(' ', _HIDDEN.sub(' ', page_html)))
+    return ' '.join(text.split())
+
+
+class SearchIndexWriter:
+    """
+    Builds a search.db from pages added in reading order. The file is written under a temporary
+    name and only renamed into place by close(), so readers never see a half-built index.
+    """
+
+    def __init__(self, db_path):
+        self.path = db_path
+        self._temp_path = f"{db_path}.{os.getpid()}.tmp"
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+        self._connection = sqlite3.connect(self._temp_path)
+        self._connection.executescript('''
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE VIRTUAL TABLE pages USING fts5(text, chapter UNINDEXED, tokenize = 'unicode61 remove_diacritics 2');
+        ''')
+        self._connection.execute("INSERT INTO meta VALUES ('version', ?)", (str(SEARCH_INDEX_VERSION),))
+        self.page_count = 0
+
+    def add_chapter(self, chapter_number, chapter):
+        """
+        Adds the pages of a chapter (0-based chapter_number), numbering them after the pages added before.
+        """
+        pages = chapter["text"]
+        rows = []
+        for local_page in sorted(pages, key=int):
+            self.page_count += 1
+            rows.append((self.page_count, page_text(pages[local_page]), chapter_number))
+        self._connection.executemany("INSERT INTO pages (rowid, text, chapter) VALUES (?, ?, ?)", rows)
+
+    def close(self):
+        self._connection.execute("INSERT INTO pages (pages) VALUES ('optimize')")
+        self._connection.commit()
+        self._connection.close()
+        os.replace(self._temp_path, self.path)
+        return self.path
+
+    def abort(self):
+        self._connection.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+
+def fts_query(text):
+    """
+    Turns search box text into an FTS5 query matching pages that contain every word, the last
+    one as a prefix so results appear while a word is still being typed.
+    """
+    words = text.split()
+    if not words:
+        return None
+    terms = ['"' + word.replace('"', '""') + '"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+class SearchIndex:
+    def __init__(self, db_path):
+        # Read-only, so a reader never locks or modifies the book's index
+        db_uri = Path(os.path.abspath(db_path)).as_uri() + "?mode=ro"
+        self._connection = sqlite3.connect(db_uri, uri=True, check_same_thread=False)
+
+    def search(self, text, limit=DEFAULT_RESULT_LIMIT, marks=('[', ']')):
+        """
+        Returns (global page number, snippet) tuples for the pages containing every word of `text`,
+        in page order. Matched words are wrapped in `marks` in the plain-text snippet.
+        """
+        query = fts_query(text)
+        if query is None:
+            return []
+        try:
+            return self._connection.execute(
+                "SELECT rowid, snippet(pages, 0, ?, ?, '...', 16) FROM pages WHERE pages MATCH ? "
+                "ORDER BY rowid LIMIT ?", (*marks, query, limit)).fetchall()
+        except sqlite3.OperationalError as e:
+            print(f"Search failed for {text!r}: {e}")
+            return []
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,112 @@
+"""
+Sorted interval index over a book's soundtrack cues.
+
+book_json["soundtracks"] maps "start-end" page ranges to an MP3 path, or to a
+list of paths for several tracks on the same range. Ranges may overlap to layer
+cues. SoundtrackIndex parses the keys once and answers "which cues cover page
+N" and "does this range overlap an existing cue" in O(log n).
+"""
+from bisect import bisect_right
+from collections import namedtuple
+
+Cue = namedtuple('Cue', ['start', 'end', 'key', 'tracks'])
+
+
+def parse_range(page_range):
+    """
+    Parses a "start-end" page range into a (start, end) tuple of ints.
+
+    Raises ValueError if the text is not two integers separated by '-'.
+    """
+    parts = page_range.strip().split('-')
+    if len(parts) != 2:
+        raise ValueError(f"Invalid page range: {page_range!r}")
+    return int(parts[0]), int(parts[1])
+
+
+def track_list(value):
+    """
+    Returns the tracks of a soundtrack entry as a list, whether it holds one path or several.
+    """
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def add_track(soundtracks, start_page, end_page, track):
+    """
+    Adds a track to a soundtracks dict, turning the entry into a list when the range already has one.
+    """
+    key = f"{start_page}-{end_page}"
+    if key in soundtracks:
+        tracks = track_list(soundtracks[key])
+        if track not in tracks:
+            tracks.append(track)
+        soundtracks[key] = tracks
+    else:
+        soundtracks[key] = track
+    return key
+
+
+class SoundtrackIndex:
+    def __init__(self, soundtracks=None):
+        cues = []
+        for key, value in (soundtracks or {}).items():
+            try:
+                start, end = parse_range(key)
+            except ValueError:
+                print(f"Ignoring soundtrack with invalid page range: {key}")
+                continue
+            if start <= end:
+                cues.append(Cue(start, end, key, tuple(track_list(value))))
+        self.cues = sorted(cues)
+
+        # For overlap checks: cue starts in order, and the furthest end reached by any cue up to each one
+        self._starts = [cue.start for cue in self.cues]
+        self._max_ends = []
+        furthest = None
+        for cue in self.cues:
+            furthest = cue.end if furthest is None else max(furthest, cue.end)
+            self._max_ends.append(furthest)
+
+        # For page lookups: split the page line at every cue boundary and record the cues covering each segment
+        boundaries = sorted({cue.start for cue in self.cues} | {cue.end + 1 for cue in self.cues})
+        self._segment_starts = boundaries
+        self._segment_cues = []
+        active = []
+        next_cue = 0
+        for segment_start in boundaries:
+            while next_cue < len(self.cues) and self.cues[next_cue].start <= segment_start:
+                active.append(self.cues[next_cue])
+                next_cue += 1
+            active = [cue for cue in active if cue.end >= segment_start]
+            self._segment_cues.append(tuple(active))
+
+    def __len__(self):
+        return len(self.cues)
+
+    def cues_at(self, page):
+        """
+        Returns the cues whose range contains `page`, ordered by start page.
+        """
+        index = bisect_right(self._segment_starts, page) - 1
+        if index < 0:
+            return ()
+        return self._segment_cues[index]
+
+    def overlaps(self, start, end):
+        """
+        Returns True if any cue shares at least one page with the range start-end.
+        """
+        index = bisect_right(self._starts, end)
+        return index > 0 and self._max_ends[index - 1] >= start
+
+    def cues_between(self, first_page, last_page):
+        """
+        Returns the cues covering any page from first_page to last_page, ordered by start page.
+        """
+        first = max(0, bisect_right(self._segment_starts, first_page) - 1)
+        last = bisect_right(self._segment_starts, last_page)
+        found = {}
+        for segment_cues in self._segment_cues[first:last]:
+            for cue in segment_cues:
+                found[cue.key] = cue
+        return sorted(found.values())
@@ -0,0 +1,203 @@
+"""
+Lightweight timers and counters shared by the converter, the converter GUI and the reader.
+
+Instrumented code calls timer("paginate") as a context manager, record() for
+durations measured across events (such as a page turn that ends when the web
+view finishes loading) and count() for counters. While telemetry is disabled
+these calls return immediately, so they can stay on the hot paths.
+
+While enabled, the last SAMPLE_WINDOW durations of every timer are kept for
+percentile stats (stats() and format_stats(), shown live in the GUIs' stats
+panels), and every event is added to a trace that dump_trace() writes in the
+Chrome trace event format, for chrome://tracing or https://ui.perfetto.dev.
+
+Telemetry is enabled by setting the EPUB_TELEMETRY environment variable, or from
+the GUIs' stats panels. With EPUB_TELEMETRY_TRACE set to a file path, the trace
+is also written there when the program exits. Worker processes do not write
+traces of their own: convert.py sends each book worker's snapshot() back to the
+main process, which merge()s it.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+
+SAMPLE_WINDOW = 1000  # Durations kept per timer for the percentiles
+MAX_TRACE_EVENTS = 200000  # Oldest trace events are dropped beyond this
+PERCENTILES = (50, 90, 99)
+
+_lock = threading.Lock()
+_samples = defaultdict(lambda: deque(maxlen=SAMPLE_WINDOW))
+_totals = defaultdict(int)  # Number of samples per timer, including those out of the window
+_counters = defaultdict(int)
+_trace = deque(maxlen=MAX_TRACE_EVENTS)
+_started = time.perf_counter()
+enabled = False
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _totals.clear()
+        _counters.clear()
+        _trace.clear()
+
+
+def _microseconds(perf_time):
+    return (perf_time - _started) * 1e6
+
+
+def record(name, seconds, ended_at=None, **args):
+    """
+    Records a duration of `seconds` for the timer `name`, which ended at the time.perf_counter()
+    `ended_at` (default: now). Keyword arguments are shown with the event in the trace.
+    """
+    if not enabled:
+        return
+    ended_at = time.perf_counter() if ended_at is None else ended_at
+    event = {"name": name, "ph": "X", "ts": _microseconds(ended_at - seconds), "dur": seconds * 1e6,
+             "pid": os.getpid(), "tid": threading.get_ident()}
+    if args:
+        event["args"] = args
+    with _lock:
+        _samples[name].append(seconds)
+        _totals[name] += 1
+        _trace.append(event)
+
+
+@contextmanager
+def _timed(name, args):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        ended = time.perf_counter()
+        record(name, ended - started, ended, **args)
+
+
+def timer(name, **args):
+    """
+    Returns a context manager that records how long its block takes as the timer `name`.
+    """
+    if not enabled:
+        return nullcontext()
+    return _timed(name, args)
+
+
+def count(name, amount=1):
+    """
+    Adds `amount` to the counter `name`.
+    """
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] += amount
+        value = _counters[name]
+        _trace.append({"name": name, "ph": "C", "ts": _microseconds(time.perf_counter()), "pid": os.getpid(),
+                       "args": {name: value}})
+
+
+def _percentile(ordered, percent):
+    # Nearest-rank percentile of an already sorted list
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def stats():
+    """
+    Returns a tuple of a dict of timer names to their count, mean, p50, p90, p99 and max in
+    milliseconds (over the last SAMPLE_WINDOW samples), and a dict of counter values.
+    """
+    with _lock:
+        samples = {name: sorted(values) for name, values in _samples.items()}
+        totals = dict(_totals)
+        counters = dict(_counters)
+    timers = {}
+    for name, ordered in samples.items():
+        summary = {"count": totals[name], "mean": 1000 * sum(ordered) / len(ordered), "max": 1000 * ordered[-1]}
+        for percent in PERCENTILES:
+            summary[f"p{percent}"] = 1000 * _percentile(ordered, percent)
+        timers[name] = summary
+    return timers, counters
+
+
+def format_stats():
+    """
+    Returns the current stats as a plain-text table for the stats panels.
+    """
+    timers, counters = stats()
+    if not enabled and not timers and not counters:
+        return "Telemetry is off. Turn it on to collect timings."
+    lines = [] if enabled else ["Telemetry is off; showing the timings collected so far.", ""]
+    lines += [f"{'timer':<22}{'count':>7}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}  ms"]
+    for name in sorted(timers):
+        summary = timers[name]
+        lines.append(f"{name:<22}{summary['count']:>7}{summary['p50']:>9.1f}{summary['p90']:>9.1f}"
+                     f"{summary['p99']:>9.1f}{summary['max']:>9.1f}")
+    if counters:
+        lines.append("")
+        lines.extend(f"{name:<22}{value:>7}" for name, value in sorted(counters.items()))
+    return "\n".join(lines)
+
+
+def snapshot():
+    """
+    Returns everything recorded so far as a picklable dict, for a worker process to send to
+    the process that merges it (see merge()).
+    """
+    with _lock:
+        return {"started": _started, "samples": {name: list(values) for name, values in _samples.items()},
+                "totals": dict(_totals), "counters": dict(_counters), "trace": list(_trace)}
+
+
+def merge(recorded):
+    """
+    Adds a snapshot() taken in another process to this process's timers, counters and trace.
+    """
+    # perf_counter is shared by the processes of a machine, only the trace's zero differs
+    offset = (recorded["started"] - _started) * 1e6
+    with _lock:
+        for name, values in recorded["samples"].items():
+            _samples[name].extend(values)
+        for name, total in recorded["totals"].items():
+            _totals[name] += total
+        for name, value in recorded["counters"].items():
+            _counters[name] += value
+        _trace.extend(dict(event, ts=event["ts"] + offset) for event in recorded["trace"])
+
+
+def dump_trace(path):
+    """
+    Writes the recorded events to `path` in the Chrome trace event format and returns the path.
+    """
+    with _lock:
+        events = list(_trace)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    os.replace(temp_path, path)
+    return path
+
+
+def _dump_trace_at_exit(path):
+    if _trace:
+        print(f"Wrote telemetry trace to {dump_trace(path)}")
+
+
+if os.environ.get("EPUB_TELEMETRY") or os.environ.get("EPUB_TELEMETRY_TRACE"):
+    enable()
+    if os.environ.get("EPUB_TELEMETRY_TRACE"):
+        atexit.register(_dump_trace_at_exit, os.environ["EPUB_TELEMETRY_TRACE"])
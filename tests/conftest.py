@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules live at the top of the repository, the benchmark helpers in benchmarks/
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+sys.path.insert(1, os.path.join(REPOSITORY, 'benchmarks'))
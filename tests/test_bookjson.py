@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+import bookjson
+from bookjson import iter_book_json, load_book_json, write_book_json
+
+BOOK = {
+    "title": "Title \"quoted\"",
+    "author": "Autor é",
+    "soundtracks": {"1-2": ["audio/a.mp3", "audio/b.mp3"]},
+    "chapters": [
+        {"title": "One", "text": {"1": "<p>first, with {braces} and [brackets]</p>", "2": "<p>second</p>"},
+         "images": {"1": {"src": "images/a.png", "width": 10, "height": 20, "variants": {}}}},
+        {"title": "Empty", "text": {}, "images": {}},
+        {"title": "Numbers", "text": {"1": "<p>1234567890</p>"}, "images": {}, "score": 1.5e-3},
+    ],
+}
+
+
+def written(tmp_path, filename, indent, book=BOOK):
+    return write_book_json(book, str(tmp_path / filename), indent)
+
+
+@pytest.mark.parametrize("indent", [None, 4])
+def test_same_layout_as_json_dump(tmp_path, indent):
+    path = written(tmp_path, "book.json", indent)
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    if indent is None:
+        assert json.loads(text) == BOOK
+    else:
+        assert text == json.dumps(BOOK, indent=indent)
+
+
+@pytest.mark.parametrize("filename, indent", [("book.json", None), ("book.json", 4), ("book.json.gz", None)])
+def test_round_trip(tmp_path, filename, indent):
+    path = written(tmp_path, filename, indent)
+    assert load_book_json(path) == BOOK
+    items = list(iter_book_json(path))
+    assert [key for key, _ in items] == ["title", "author", "soundtracks", "chapter", "chapter", "chapter"]
+    assert [value for key, value in items if key == "chapter"] == BOOK["chapters"]
+
+
+def test_chapters_are_written_as_they_are_generated(tmp_path):
+    generated = []
+
+    def chapters():
+        for chapter in BOOK["chapters"]:
+            generated.append(chapter["title"])
+            yield chapter
+
+    path = written(tmp_path, "book.json", None, dict(BOOK, chapters=chapters()))
+    assert generated == ["One", "Empty", "Numbers"]
+    assert load_book_json(path) == BOOK
+
+
+def test_chapters_are_read_one_at_a_time(tmp_path, monkeypatch):
+    monkeypatch.setattr(bookjson, "READ_CHUNK_SIZE", 7)  # Values and numbers span many reads
+    big_chapter = {"title": "Big", "text": {str(n): "<p>" + "word " * 500 + "</p>" for n in range(1, 20)}, "images": {}}
+    book = dict(BOOK, chapters=BOOK["chapters"] + [big_chapter])
+    path = written(tmp_path, "book.json", 2, book)
+    assert load_book_json(path) == book
+
+
+def test_empty_book(tmp_path):
+    path = written(tmp_path, "book.json", None, {"title": "T", "author": "A", "soundtracks": {}, "chapters": []})
+    assert list(iter_book_json(path)) == [("title", "T"), ("author", "A"), ("soundtracks", {})]
+    assert load_book_json(path)["chapters"] == []
+
+
+def test_failed_write_keeps_the_previous_file(tmp_path):
+    path = written(tmp_path, "book.json", None)
+
+    def chapters():
+        yield BOOK["chapters"][0]
+        raise RuntimeError("cancelled")
+
+    with pytest.raises(RuntimeError):
+        written(tmp_path, "book.json", None, dict(BOOK, chapters=chapters()))
+    assert [item.name for item in tmp_path.iterdir()] == ["book.json"]
+    assert load_book_json(path) == BOOK
+
+
+def test_truncated_file_raises(tmp_path):
+    path = written(tmp_path, "book.json", None)
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text[:len(text) // 2])
+    with pytest.raises(ValueError):
+        load_book_json(path)
@@ -0,0 +1,70 @@
+import pytest
+
+from bookjson import write_book_json
+from bookpack import PackedBook, import_book_json, write_pack
+
+BOOK = {
+    "title": "Title",
+    "author": "Author",
+    "soundtracks": {"1-2": "audio/a.mp3"},
+    "chapters": [
+        {"title": "One", "text": {1: "<p>first</p>", 2: "<p>second é</p>"}, "images": {"1": "images/a.png"}},
+        {"title": "Empty", "text": {}, "images": {}},
+        {"title": "Two", "text": {"2": "<p>fourth</p>", "1": "<p>third</p>"}, "images": {}},
+    ],
+}
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_round_trip(tmp_path, compress):
+    pack_path = write_pack(BOOK, str(tmp_path / "book.pack"), compress)
+    with PackedBook(pack_path) as book:
+        assert (book.title, book.author, book.soundtracks) == ("Title", "Author", {"1-2": "audio/a.mp3"})
+        assert [(chapter["title"], chapter["pages"]) for chapter in book.chapters] == [("One", 2), ("Empty", 0), ("Two", 2)]
+        assert book.chapters[0]["images"] == {"1": "images/a.png"}
+        assert len(book) == 4
+        assert [book[n] for n in range(1, 5)] == ["<p>first</p>", "<p>second é</p>", "<p>third</p>", "<p>fourth</p>"]
+        assert 0 not in book and 5 not in book and "1" not in book
+        assert book.get(5) is None
+        with pytest.raises(KeyError):
+            book[0]
+
+
+def test_chapters_may_be_a_generator(tmp_path):
+    pack_path = write_pack(dict(BOOK, chapters=iter(BOOK["chapters"])), str(tmp_path / "book.pack"))
+    with PackedBook(pack_path) as book:
+        assert len(book) == 4
+
+
+def test_failed_write_leaves_no_file(tmp_path):
+    def chapters():
+        yield BOOK["chapters"][0]
+        raise RuntimeError("cancelled")
+
+    with pytest.raises(RuntimeError):
+        write_pack(dict(BOOK, chapters=chapters()), str(tmp_path / "book.pack"))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "book.pack"
+    path.write_bytes(b"not a pack" * 10)
+    with pytest.raises(ValueError):
+        PackedBook(str(path))
+
+
+@pytest.mark.parametrize("filename", ["book.json", "book.json.gz"])
+def test_import_book_json(tmp_path, filename):
+    json_path = write_book_json(BOOK, str(tmp_path / filename), indent=4)
+    with PackedBook(import_book_json(json_path)) as book:
+        assert book.path == str(tmp_path / "book.pack")
+        assert book.title == "Title"
+        assert [book[n] for n in range(1, 5)] == ["<p>first</p>", "<p>second é</p>", "<p>third</p>", "<p>fourth</p>"]
+
+
+def test_saving_removes_book_files_of_other_formats(tmp_path):
+    conversion = pytest.importorskip("conversion")
+    for book_format, kept in [("json", "book.json"), ("pack", "book.pack"), ("gzip", "book.json.gz"),
+                              ("compact", "book.json"), ("pack", "book.pack")]:
+        conversion._write_book_file(dict(BOOK), str(tmp_path), book_format)
+        assert [path.name for path in tmp_path.iterdir()] == [kept]
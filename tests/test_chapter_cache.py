@@ -0,0 +1,85 @@
+import json
+import os
+
+import chapter_cache
+from chapter_cache import USAGE_FILENAME, ChapterCache
+
+
+def entry_bytes(cache):
+    return sum(size for _, size, _ in cache._entries())
+
+
+def recorded_bytes(cache):
+    with open(os.path.join(cache.folder, USAGE_FILENAME)) as f:
+        return json.load(f)["bytes"]
+
+
+def test_get_returns_what_was_put(tmp_path):
+    cache = ChapterCache(str(tmp_path))
+    key = cache.key("<p>body</p>", {"version": 1})
+    assert cache.get(key) is None
+    cache.put(key, {1: "<p>one</p>", 2: "<p>two</p>"}, ["images/a.png"])
+    assert cache.get(key) == ({1: "<p>one</p>", 2: "<p>two</p>"}, ["images/a.png"])
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+
+def test_key_depends_on_body_and_params(tmp_path):
+    cache = ChapterCache(str(tmp_path))
+    key = cache.key("<p>body</p>", {"version": 1})
+    assert key == cache.key("<p>body</p>", {"version": 1})
+    assert key != cache.key("<p>other</p>", {"version": 1})
+    assert key != cache.key("<p>body</p>", {"version": 2})
+
+
+def test_replacing_an_entry_does_not_count_it_twice(tmp_path):
+    cache = ChapterCache(str(tmp_path))
+    key = cache.key("<p>body</p>", {})
+    for _ in range(3):
+        cache.put(key, {1: "<p>page</p>"}, [])
+    assert cache._total_bytes == entry_bytes(cache) == recorded_bytes(cache)
+
+
+def test_usage_is_shared_with_later_instances(tmp_path, monkeypatch):
+    cache = ChapterCache(str(tmp_path))
+    cache.put(cache.key("a", {}), {1: "<p>a</p>"}, [])
+    walked = []
+    monkeypatch.setattr(ChapterCache, "_entries", lambda self: walked.append(1) or iter(()))
+    other = ChapterCache(str(tmp_path))
+    assert not walked
+    assert other._total_bytes == cache._total_bytes
+    other.put(other.key("b", {}), {1: "<p>b</p>"}, [])
+    cache.put(cache.key("c", {}), {1: "<p>c</p>"}, [])
+    assert not walked
+    monkeypatch.undo()
+    assert recorded_bytes(cache) == entry_bytes(cache)
+
+
+def test_evicts_least_recently_used_down_to_low_water_mark(tmp_path):
+    cache = ChapterCache(str(tmp_path), max_bytes=10 ** 9)
+    keys = [cache.key(str(number), {}) for number in range(10)]
+    for number, key in enumerate(keys):
+        cache.put(key, {1: os.urandom(200).hex()}, [])
+        os.utime(cache._path(key), (number, number))
+    cache.get(keys[0])  # Now the most recently used
+    size = entry_bytes(cache) // 10
+
+    cache.max_bytes = size * 8
+    cache.evict()
+    assert entry_bytes(cache) <= cache.max_bytes * chapter_cache.EVICT_TO
+    assert cache._total_bytes == entry_bytes(cache) == recorded_bytes(cache)
+    kept = [key for key in keys if os.path.exists(cache._path(key))]
+    assert kept == [keys[0]] + keys[-len(kept) + 1:]
+
+
+def test_put_over_limit_evicts_once_for_several_puts(tmp_path, monkeypatch):
+    cache = ChapterCache(str(tmp_path), max_bytes=10 ** 9)
+    cache.put(cache.key("first", {}), {1: os.urandom(1000).hex()}, [])
+    cache.max_bytes = entry_bytes(cache) * 20
+    evictions = []
+    original_evict = ChapterCache.evict
+    monkeypatch.setattr(ChapterCache, "evict", lambda self: evictions.append(1) or original_evict(self))
+    for number in range(40):
+        cache.put(cache.key(str(number), {}), {1: os.urandom(1000).hex()}, [])
+    assert entry_bytes(cache) <= cache.max_bytes
+    # Each eviction frees room for two more entries instead of one
+    assert 1 <= len(evictions) <= 40 // 2
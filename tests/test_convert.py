@@ -0,0 +1,49 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+convert = pytest.importorskip("convert")
+
+# The stubbed convert_book only reaches the workers when they are forked
+pytestmark = pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                                reason="needs the fork start method")
+
+
+def fake_convert_book(epub_file_path, output_folder, *args):
+    name = os.path.basename(epub_file_path)
+    if name.startswith("raise"):
+        raise ValueError("bad book")
+    if name.startswith("crash"):
+        os._exit(1)
+    if name.startswith("hang"):
+        time.sleep(60)
+    if name.startswith("slow"):
+        time.sleep(1.0)
+    return os.path.join(output_folder, name + ".json")
+
+
+@pytest.fixture
+def stubbed(monkeypatch):
+    monkeypatch.setattr(convert, "convert_book", fake_convert_book)
+
+
+def test_each_outcome_is_reported_without_affecting_the_others(tmp_path, stubbed):
+    books = [str(tmp_path / name) for name in ["ok1.epub", "raise.epub", "crash.epub", "hang.epub", "ok2.epub"]]
+    started = time.monotonic()
+    results = convert.convert_all(books, str(tmp_path), workers=3, timeout=2)
+    assert time.monotonic() - started < 30
+    assert [result["epub"] for result in results] == books
+    assert [result["status"] for result in results] == ["ok", "failed", "failed", "timeout", "ok"]
+    assert results[0]["detail"] == str(tmp_path / "ok1.epub.json")
+    assert results[1]["detail"] == "ValueError: bad book"
+    assert results[2]["detail"] == "Worker exited with code 1"
+    assert results[3]["detail"] == "Timed out after 2 seconds"
+
+
+def test_books_finishing_at_their_timeout_do_not_abort_the_batch(tmp_path, stubbed):
+    books = [str(tmp_path / f"slow{number}.epub") for number in range(16)]
+    results = convert.convert_all(books, str(tmp_path), workers=16, timeout=1.003)
+    assert len(results) == 16
+    assert {result["status"] for result in results} <= {"ok", "timeout"}
@@ -0,0 +1,46 @@
+from image_variants import pick_variant
+
+PORTRAIT = {"src": "images/a.jpg", "width": 3000, "height": 4000,
+            "variants": {"display": {"src": "images/a.display.jpg", "width": 792, "height": 1056},
+                         "thumb": {"src": "images/a.thumb.jpg", "width": 195, "height": 260}}}
+LANDSCAPE = {"src": "images/b.jpg", "width": 4000, "height": 3000,
+             "variants": {"display": {"src": "images/b.display.jpg", "width": 816, "height": 612},
+                          "thumb": {"src": "images/b.thumb.jpg", "width": 200, "height": 150}}}
+
+
+def test_plain_paths_are_returned_as_they_are():
+    assert pick_variant("images/a.jpg", 816, 1056) == "images/a.jpg"
+
+
+def test_portrait_uses_display_variant_that_reaches_page_height():
+    assert pick_variant(PORTRAIT, 816, 1056) == "images/a.display.jpg"
+
+
+def test_landscape_uses_display_variant_that_reaches_page_width():
+    assert pick_variant(LANDSCAPE, 816, 1056) == "images/b.display.jpg"
+
+
+def test_width_only_viewport():
+    assert pick_variant(LANDSCAPE, 816) == "images/b.display.jpg"
+
+
+def test_small_viewport_uses_thumbnail():
+    assert pick_variant(PORTRAIT, 200, 260) == "images/a.thumb.jpg"
+    assert pick_variant(LANDSCAPE, 150, 400) == "images/b.thumb.jpg"
+
+
+def test_hidpi_uses_original_when_no_variant_is_large_enough():
+    assert pick_variant(PORTRAIT, 816, 1056, pixel_ratio=2.0) == "images/a.jpg"
+    assert pick_variant(LANDSCAPE, 816, 1056, pixel_ratio=2.0) == "images/b.jpg"
+
+
+def test_hidpi_uses_variant_that_covers_the_device_pixels():
+    # A 200x260 box at 2x needs 390x520 device pixels, which the display copy covers
+    assert pick_variant(PORTRAIT, 200, 260, pixel_ratio=2.0) == "images/a.display.jpg"
+    assert pick_variant(PORTRAIT, 400, 528, pixel_ratio=2.0) == "images/a.display.jpg"
+    assert pick_variant(PORTRAIT, 400, 540, pixel_ratio=2.0) == "images/a.jpg"
+
+
+def test_entry_without_variants_uses_original():
+    entry = {"src": "images/d.jpg", "width": 3000, "height": 4000, "variants": {}}
+    assert pick_variant(entry, 816, 1056) == "images/d.jpg"
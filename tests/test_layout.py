@@ -0,0 +1,148 @@
+import random
+import struct
+import zlib
+from html.parser import HTMLParser
+
+import pytest
+
+from layout import LayoutProfile, image_dimensions, paginate_chapter_layout
+from pagination import VOID_TAGS, paginate_chapter
+
+WORDS = "the of and to in a is that for it as was with be by on not he this are".split()
+SMALL_PAGE = LayoutProfile(viewport_width=400, viewport_height=300)
+
+
+class _PageChecker(HTMLParser):
+    """Collects a page's words and the tags left open or closed without being opened."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.words = []
+        self.open_tags = []
+        self.unbalanced = []
+        self._skipped = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+            self._skipped += tag in ('script', 'style')
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+        if not self.open_tags or self.open_tags[-1] != tag:
+            self.unbalanced.append(tag)
+            return
+        self.open_tags.pop()
+        self._skipped -= tag in ('script', 'style')
+
+    def handle_data(self, data):
+        if not self._skipped:
+            self.words.extend(data.split())
+
+
+def parse(page_html):
+    checker = _PageChecker()
+    checker.feed(page_html)
+    checker.close()
+    return checker
+
+
+def check_page(page_html):
+    checker = parse(page_html)
+    assert checker.unbalanced == [] and checker.open_tags == [], page_html
+    return checker.words
+
+
+def words_of(pages):
+    return [word for number in sorted(pages) for word in check_page(pages[number])]
+
+
+def paragraph(rng, words):
+    text = ' '.join(rng.choice(WORDS) for _ in range(words))
+    if rng.random() < 0.3:
+        text = f"<b>{text}</b> <i>and <span>more</span> text</i>"
+    return text
+
+
+def make_chapter(rng):
+    blocks = []
+    for _ in range(rng.randint(5, 40)):
+        kind = rng.random()
+        if kind < 0.1:
+            level = rng.randint(1, 3)
+            blocks.append(f"<h{level}>{paragraph(rng, rng.randint(1, 8))}</h{level}>")
+        elif kind < 0.2:
+            blocks.append(f"<ul><li>{paragraph(rng, 20)}</li><li>{paragraph(rng, 30)}</li></ul>")
+        elif kind < 0.3:
+            blocks.append(f"<blockquote><p>{paragraph(rng, rng.randint(10, 200))}</p></blockquote>")
+        elif kind < 0.35:
+            blocks.append(f"<img src='images/{rng.randint(0, 3)}.png'/>")
+        elif kind < 0.4:
+            blocks.append("<pre>" + " line\n" * rng.randint(1, 40) + "</pre>")
+        elif kind < 0.45:
+            blocks.append(f"<div><div><p>{paragraph(rng, rng.randint(10, 400))}</p></div><br/>tail</div>")
+        else:
+            blocks.append(f"<p>{paragraph(rng, rng.randint(1, 600))}</p>")
+    return ''.join(blocks)
+
+
+IMAGE_SIZES = {"images/0.png": (3000, 4000), "images/1.png": (200, 100), "images/2.png": (0, 0)}
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_pages_keep_all_text_and_balance_their_tags(seed):
+    html = make_chapter(random.Random(seed))
+    pages, images = paginate_chapter_layout(html, SMALL_PAGE, IMAGE_SIZES)
+    assert list(pages) == list(range(1, len(pages) + 1))
+    assert words_of(pages) == parse(html).words
+    assert images == paginate_chapter(html)[1]
+
+
+def test_unclosed_and_stray_tags_are_balanced():
+    html = "<p>unclosed <b>bold <i>italic<p>next</div> paragraph</span>" + "<p>" + " word" * 2000
+    pages, _ = paginate_chapter_layout(html, SMALL_PAGE)
+    assert words_of(pages) == parse(html).words
+
+
+def test_long_paragraph_is_split_with_its_inline_tags():
+    html = "<p><b>" + " ".join(["word"] * 3000) + "</b></p>"
+    pages, _ = paginate_chapter_layout(html, SMALL_PAGE)
+    assert len(pages) > 5
+    assert all(page.startswith("<p><b>") and page.endswith("</b></p>") for page in pages.values())
+    assert words_of(pages) == ["word"] * 3000
+
+
+def test_smaller_viewport_makes_more_pages():
+    html = make_chapter(random.Random(7))
+    counts = [len(paginate_chapter_layout(html, LayoutProfile(viewport_height=height))[0])
+              for height in (2000, 1056, 500)]
+    assert counts == sorted(counts) and counts[0] < counts[-1]
+
+
+def test_heading_is_kept_with_the_text_after_it():
+    filler = "<p>" + " ".join(["word"] * 20) + "</p>"
+    for count in range(1, 40):
+        pages, _ = paginate_chapter_layout(filler * count + "<h2>Heading</h2>" + filler, SMALL_PAGE)
+        assert not any(page.rstrip().endswith("</h2>") for page in pages.values())
+
+
+def test_profile_round_trip(tmp_path):
+    profile = LayoutProfile(viewport_width=700, font_size=18, char_width=0.5)
+    path = profile.save(str(tmp_path / "layout" / "layout.json"))
+    assert LayoutProfile.load(path) == profile
+    assert LayoutProfile.load(str(tmp_path / "missing.json")) == LayoutProfile()
+
+
+def png(width, height):
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + header + struct.pack('>I', zlib.crc32(b'IHDR' + header))
+
+
+def test_image_dimensions():
+    assert image_dimensions(png(123, 45)) == (123, 45)
+    assert image_dimensions(b'GIF89a' + struct.pack('<HH', 12, 34)) == (12, 34)
+    jpeg = b'\xff\xd8' + b'\xff\xe0' + struct.pack('>H', 4) + b'\0\0' + b'\xff\xc0' + struct.pack('>HBHH', 11, 8, 56, 78) + b'\0' * 8
+    assert image_dimensions(jpeg) == (78, 56)
+    assert image_dimensions(b'not an image') is None
+    assert image_dimensions(b'\x89PNG\r\n\x1a\n') is None
@@ -0,0 +1,56 @@
+import pytest
+
+from page_index import ChapterPages, PageIndex, chapter_page_count
+
+
+def test_chapter_page_count():
+    assert chapter_page_count({"text": {1: "a", 2: "b"}}) == 2
+    assert chapter_page_count({"pages": 7}) == 7
+
+
+def test_counts_and_starts():
+    index = PageIndex([3, 0, 2])
+    assert (index.chapter_count, index.page_count, len(index)) == (3, 5, 5)
+    assert [index.chapter_pages(chapter) for chapter in range(3)] == [3, 0, 2]
+    assert [index.chapter_start(chapter) for chapter in range(3)] == [1, 4, 4]
+
+
+def test_locate_and_to_global_round_trip():
+    counts = [3, 0, 0, 2, 1, 0, 4]
+    index = PageIndex(counts)
+    expected = [(chapter, page) for chapter, count in enumerate(counts) for page in range(1, count + 1)]
+    assert [index.locate(number) for number in range(1, index.page_count + 1)] == expected
+    for number, (chapter, page) in enumerate(expected, start=1):
+        assert index.to_global(chapter, page) == number
+
+
+@pytest.mark.parametrize("number", [0, -1, 11])
+def test_locate_outside_the_book(number):
+    with pytest.raises(IndexError):
+        PageIndex([3, 0, 2, 5]).locate(number)
+
+
+def test_append():
+    index = PageIndex()
+    with pytest.raises(IndexError):
+        index.locate(1)
+    index.append(2)
+    index.append(0)
+    index.append(3)
+    assert index.page_count == 5
+    assert index.locate(2) == (0, 2)
+    assert index.locate(3) == (2, 1)
+    assert index.to_global(2, 3) == 5
+
+
+def test_chapter_pages_view():
+    chapters = [{"text": {1: "one", 2: "two"}}, {"text": {}}, {"text": {"1": "three"}}]
+    pages = ChapterPages(chapters)
+    assert len(pages) == 3
+    assert [pages[number] for number in range(1, 4)] == ["one", "two", "three"]
+    assert 0 not in pages and 4 not in pages and "1" not in pages
+    assert pages.get(4, "missing") == "missing"
+    with pytest.raises(KeyError):
+        pages[4]
+    pages.append({"text": {"1": "four"}})
+    assert pages[4] == "four"
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import random
+
+import pytest
+
+from pagination import PAGINATION_VERSION, paginate_chapter
+
+pytest.importorskip("bs4")
+pytest.importorskip("ebooklib")
+from bench_pagination import legacy_paginate  # noqa: E402
+from synthetic_epub import make_chapter  # noqa: E402
+
+pytestmark = pytest.mark.filterwarnings("ignore:It looks like you're using an HTML parser")
+
+CHAPTERS = [
+    "",
+    "plain text outside any paragraph",
+    "<p>One paragraph.</p>",
+    "<h1>Title</h1><p>First</p><p>Second</p>",
+    "<div><p>nested <b>bold</b> and <i>italic</i></p><div><p>deeper</p></div></div>",
+    "<p>unclosed <span>span<p>next paragraph",
+    "<p>stray end tag</b> text</div></p>",
+    "<p>entities &amp; &lt;tag&gt; &nbsp; &eacute; &#233; &#x00e9; &notanentity; &amp</p>",
+    "<p class='  a   b  ' id=x data-v=\"1 &amp; 2\">attributes</p>",
+    "<p>image <img src='images/a.png' alt='a'> inside text</p><img src='images/b.png'/>",
+    "<p>br<br>and hr<hr/>void tags</p>",
+    "<pre>  keep\n   whitespace  </pre><p>  \n  </p>",
+    "<p>comment <!-- hidden --> and cdata <![CDATA[raw]]></p>",
+    "<!DOCTYPE html><?xml version='1.0'?><p>declarations</p>",
+    "<p><script>if (a < b) { x = '</p>'; }</script><style>p > b { color: red }</style>text</p>",
+    "<p>ruby <ruby>漢<rt>kan</rt><rp>(</rp></ruby> text</p>",
+    "<table><tr><td><p>cell one</p></td><td>cell two</td></tr></table>",
+    "<ul><li><p>item</p></li><li>item two</li></ul>",
+    "<P>Upper case <B>tags</B></P>",
+    " ".join(f"<p>{' '.join(['word'] * 100)}</p>" for _ in range(20)),
+    "<p>" + " ".join(["word"] * 1200) + "</p><p>after a long paragraph</p>",
+    "<h2>" + " ".join(["heading"] * 600) + "</h2>",
+]
+
+
+def synthetic_chapters():
+    rng = random.Random(0)
+    return [make_chapter(rng, paragraphs, nesting, [f"images/{n}.png" for n in range(images)])
+            for paragraphs, nesting, images in [(30, 0, 0), (200, 3, 2), (400, 6, 5)]]
+
+
+@pytest.mark.parametrize("html", CHAPTERS + synthetic_chapters())
+def test_matches_legacy_beautifulsoup_paginator(html):
+    assert paginate_chapter(html) == legacy_paginate(html)
+
+
+# Digest of the pages produced for CHAPTERS, per PAGINATION_VERSION. When a change alters the
+# pages, bump PAGINATION_VERSION (so cached chapters are re-paginated) and add its digest here.
+EXPECTED_DIGESTS = {
+    1: "6caa2e4bf2137b495086c425544f1733ed1b6b2ba308e6e7a6ece1e6cac2ffa2",
+}
+
+
+def test_output_changes_come_with_a_version_bump():
+    pages = [paginate_chapter(html) for html in CHAPTERS]
+    digest = hashlib.sha256(json.dumps(pages, sort_keys=True).encode('utf-8')).hexdigest()
+    assert EXPECTED_DIGESTS.get(PAGINATION_VERSION) == digest
+
+
+def test_images_without_source_are_skipped():
+    # The BeautifulSoup paginator raised KeyError on these
+    assert paginate_chapter("<p>text</p><img alt='no src'>") == ({1: "<p>text</p>"}, [])
+
+
+def test_custom_page_size():
+    pages, images = paginate_chapter("<p>one two three</p><p>four five</p><p>six</p>", words_per_page=4)
+    assert pages == {1: "<p>one two three</p>", 2: "<p>four five</p><p>six</p>"}
+    assert images == []
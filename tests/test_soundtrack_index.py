@@ -0,0 +1,89 @@
+import pytest
+
+from soundtrack_index import SoundtrackIndex, add_track, parse_range, track_list
+
+SOUNDTRACKS = {
+    "1-5": "a.mp3",
+    "5-8": ["b.mp3", "c.mp3"],
+    "10-10": "d.mp3",
+    "3-12": "e.mp3",
+    "20-25": "f.mp3",
+}
+
+
+def brute_force_cues_at(index, page):
+    return tuple(cue for cue in index.cues if cue.start <= page <= cue.end)
+
+
+def test_parse_range():
+    assert parse_range(" 3-12 ") == (3, 12)
+    for text in ["3", "3-4-5", "a-b", ""]:
+        with pytest.raises(ValueError):
+            parse_range(text)
+
+
+def test_track_list_and_add_track():
+    assert track_list("a.mp3") == ["a.mp3"]
+    assert track_list(("a.mp3", "b.mp3")) == ["a.mp3", "b.mp3"]
+    soundtracks = {}
+    assert add_track(soundtracks, 1, 5, "a.mp3") == "1-5"
+    add_track(soundtracks, 1, 5, "b.mp3")
+    add_track(soundtracks, 1, 5, "a.mp3")
+    assert soundtracks == {"1-5": ["a.mp3", "b.mp3"]}
+
+
+def test_invalid_and_reversed_ranges_are_ignored():
+    index = SoundtrackIndex({"bad": "a.mp3", "9-3": "b.mp3", "1-2": "c.mp3"})
+    assert [cue.key for cue in index.cues] == ["1-2"]
+
+
+def test_cues_at_range_boundaries():
+    index = SoundtrackIndex(SOUNDTRACKS)
+    assert index.cues_at(0) == ()
+    assert [cue.key for cue in index.cues_at(1)] == ["1-5"]
+    assert [cue.key for cue in index.cues_at(5)] == ["1-5", "3-12", "5-8"]
+    assert [cue.key for cue in index.cues_at(6)] == ["3-12", "5-8"]
+    assert [cue.key for cue in index.cues_at(10)] == ["3-12", "10-10"]
+    assert [cue.key for cue in index.cues_at(13)] == []
+    assert [cue.key for cue in index.cues_at(25)] == ["20-25"]
+    assert index.cues_at(26) == ()
+    assert index.cues_at(5)[2].tracks == ("b.mp3", "c.mp3")
+    for page in range(-1, 30):
+        assert index.cues_at(page) == brute_force_cues_at(index, page)
+
+
+def test_overlaps_at_range_boundaries():
+    index = SoundtrackIndex(SOUNDTRACKS)
+    assert index.overlaps(12, 19)
+    assert not index.overlaps(13, 19)
+    assert index.overlaps(13, 20)
+    assert index.overlaps(25, 30)
+    assert not index.overlaps(26, 30)
+    assert not index.overlaps(-5, 0)
+    assert index.overlaps(0, 1)
+    assert index.overlaps(15, 15) is False
+    assert index.overlaps(22, 22)
+    for start in range(0, 28):
+        for end in range(start, 28):
+            expected = any(cue.start <= end and start <= cue.end for cue in index.cues)
+            assert index.overlaps(start, end) == expected
+
+
+def test_cues_between_range_boundaries():
+    index = SoundtrackIndex(SOUNDTRACKS)
+    assert [cue.key for cue in index.cues_between(13, 19)] == []
+    assert [cue.key for cue in index.cues_between(12, 20)] == ["3-12", "20-25"]
+    assert [cue.key for cue in index.cues_between(0, 1)] == ["1-5"]
+    assert [cue.key for cue in index.cues_between(26, 40)] == []
+    for first in range(0, 28):
+        for last in range(first, 28):
+            expected = sorted(cue for cue in index.cues if cue.start <= last and first <= cue.end)
+            assert index.cues_between(first, last) == expected
+
+
+def test_empty_index():
+    index = SoundtrackIndex()
+    assert len(index) == 0
+    assert index.cues_at(1) == ()
+    assert not index.overlaps(1, 100)
+    assert index.cues_between(1, 100) == []